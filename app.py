@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import os
 import json
@@ -22,117 +23,212 @@ class UniqueIDGenerator:
     """Generates unique IDs that are never repeated across sessions"""
     
     def __init__(self):
-        self.counter_file = "data/id_counter.json"
+        # Shared with id_generator.UniqueIDGenerator: a plain integer, with the
+        # JSON file written by older versions read only until the first save
+        self.counter_file = "data/id_counter.txt"
+        self.legacy_counter_file = "data/id_counter.json"
+        self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.counter_file), exist_ok=True)
+        except OSError:
+            pass  # save_counter will fail quietly and we continue with session state
         self.load_counter()
     
     def load_counter(self):
         """Load the current counter from file, or start at 1 if file doesn't exist"""
         if 'id_counter' not in st.session_state:
             try:
-                if os.path.exists(self.counter_file):
-                    with open(self.counter_file, 'r') as f:
-                        data = json.load(f)
-                        st.session_state['id_counter'] = data.get('counter', 1)
-                else:
-                    st.session_state['id_counter'] = 1
+                st.session_state['id_counter'] = self._read_counter()
             except:
                 st.session_state['id_counter'] = 1
     
+    def _read_counter(self):
+        """Read the saved counter, falling back to the legacy {"counter": N} JSON file"""
+        try:
+            with open(self.counter_file, 'r') as f:
+                return int(f.read().strip())
+        except FileNotFoundError:
+            pass
+        
+        try:
+            with open(self.legacy_counter_file, 'r') as f:
+                return json.load(f).get('counter', 1)
+        except FileNotFoundError:
+            return 1
+    
     def save_counter(self):
-        """Save the current counter to file"""
+        """Save the current counter to file as a plain integer (atomically, via a temp file)"""
         try:
-            os.makedirs(os.path.dirname(self.counter_file), exist_ok=True)
-            with open(self.counter_file, 'w') as f:
-                json.dump({'counter': st.session_state['id_counter']}, f)
+            tmp_file = self.counter_file + '.tmp'
+            with open(tmp_file, 'w') as f:
+                f.write(str(st.session_state['id_counter']))
+            os.replace(tmp_file, self.counter_file)
+            self._dirty = False
         except:
             pass  # If we can't save, we'll just continue with session state
     
+    def flush(self):
+        """Persist the counter if IDs were handed out since the last save"""
+        if self._dirty:
+            self.save_counter()
+    
     def get_next_id(self):
-        """Get the next unique ID and increment counter"""
-        current_id = st.session_state['id_counter']
-        st.session_state['id_counter'] += 1
-        self.save_counter()
+        """Get the next unique ID and increment counter (call flush() to persist)"""
+        return self.get_ids(1)[0]
+    
+    def get_ids(self, count):
+        """Reserve a batch of unique IDs sharing one timestamp (call flush() to persist)"""
+        start = st.session_state['id_counter']
+        st.session_state['id_counter'] += count
+        self._dirty = True
         
-        # Create a unique ID using timestamp and counter
+        # Create unique IDs using timestamp and counter
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        unique_id = f"VT{timestamp}{current_id:06d}"
-        
-        return unique_id
+        return [f"VT{timestamp}{current_id:06d}" for current_id in range(start, start + count)]
 
 # Global ID generator instance
 id_generator = UniqueIDGenerator()
 
+# ============================================================================
+# DEBUG HELPERS
+# ============================================================================
+
+def debug_write(message):
+    """Write a debug message only when debug mode is enabled"""
+    if st.session_state.get('debug'):
+        st.write(message)
+
 # ============================================================================
 # FILE PROCESSOR FUNCTIONS
 # ============================================================================
 
-def load_csv_file(uploaded_file):
-    """Load and validate CSV file"""
+# Columns required (and read) for each uploaded file
+ANCHORAGE_COLS = (
+    'End Time', 'Type', 'Asset Type', 'Asset Quantity (Before Fee)',
+    'Value (USD)', 'Fee Quantity', 'Fee Value (USD)', 'Fee Asset Type',
+    'Source Addresses', 'Destination Address'
+)
+WALLETS_COLS = ('ID', 'Name')
+VESTING_PAIRS_COLS = ('Beneficiary Wallet', 'Originating Wallet')
+BITWAVE_COLS = ('id', 'dateTime', 'walletId', 'amount')
+
+# Required columns and display name for each file kind accepted by validate()
+SCHEMA_REGISTRY = {
+    'anchorage': ANCHORAGE_COLS,
+    'wallets': WALLETS_COLS,
+    'pairs': VESTING_PAIRS_COLS,
+    'bitwave': BITWAVE_COLS,
+}
+SCHEMA_LABELS = {
+    'anchorage': None,
+    'wallets': 'Wallets List',
+    'pairs': 'Vesting Wallet Pairs',
+    'bitwave': 'Bitwave Export',
+}
+
+# Low-cardinality wallet identifiers, stored as categoricals so joins and groupbys work on integer codes
+CATEGORY_COLS = ('Addresses', 'Source Addresses', 'Destination Address', 'Beneficiary Wallet', 'Originating Wallet')
+
+def categorize_wallet_columns(df):
+    """Convert any wallet identifier columns present in df to categoricals"""
+    for col in CATEGORY_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def has_numeric_values(df, col):
+    """Whether df has column col parsed as numbers (all-empty columns don't count)"""
+    return col in df.columns and pd.api.types.is_numeric_dtype(df[col]) and df[col].notna().any()
+
+def read_csv_fast(source, usecols=None):
+    """Read a CSV with the multithreaded pyarrow engine, falling back to the default engine
+    
+    When usecols is given only those columns are parsed; missing ones are skipped
+    so the validators can report them.
+    """
+    present_columns = None
+    if usecols is not None:
+        # pyarrow needs an explicit column list, so resolve usecols against the header
+        header = pd.read_csv(source, nrows=0).columns
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        wanted = set(usecols)
+        present_columns = [col for col in header if col in wanted]
+    
+    try:
+        df = pd.read_csv(source, engine='pyarrow', usecols=present_columns)
+        # pyarrow infers short hex addresses such as 0x1 as integers; the default
+        # engine keeps them as text, so reread when an identifier column came back numeric
+        if not any(has_numeric_values(df, col) for col in CATEGORY_COLS):
+            return df
+    except Exception:
+        pass  # pyarrow not installed or unable to parse this file
+    
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return pd.read_csv(source, usecols=present_columns)
+
+@st.cache_data(show_spinner=False)
+def read_reference_csv(path, mtime):
+    """Read a reference CSV; cached until the file's modification time changes"""
+    return categorize_wallet_columns(read_csv_fast(path))
+
+def parse_timestamps(values):
+    """Parse timestamps, coercing bad values to NaT and dropping any timezone"""
+    parsed = pd.to_datetime(values, errors='coerce', cache=True)
+    if getattr(parsed.dt, "tz", None) is not None:
+        parsed = parsed.dt.tz_convert(None)
+    return parsed
+
+@st.cache_data(show_spinner=False)
+def read_uploaded_csv(file_id, size, _uploaded_file, date_column=None, usecols=None):
+    """Parse an uploaded CSV; cached per upload so reruns skip re-parsing"""
+    _uploaded_file.seek(0)
+    df = read_csv_fast(_uploaded_file, usecols)
+    if date_column in df.columns:
+        df[date_column] = parse_timestamps(df[date_column])
+    return categorize_wallet_columns(df)
+
+def load_csv_file(uploaded_file, date_column=None, usecols=None):
+    """Load and validate CSV file, optionally parsing a timestamp column once at load"""
     try:
         if uploaded_file is not None:
-            df = pd.read_csv(uploaded_file)
+            df = read_uploaded_csv(uploaded_file.file_id, uploaded_file.size, uploaded_file, date_column, usecols)
             return df
         return None
     except Exception as e:
         st.error(f"Error loading file: {str(e)}")
         return None
 
-def validate_anchorage_file(df):
-    """Validate Anchorage Transaction Report format"""
-    required_columns = [
-        'End Time', 'Type', 'Asset Type', 'Asset Quantity (Before Fee)',
-        'Value (USD)', 'Fee Quantity', 'Fee Value (USD)', 'Fee Asset Type',
-        'Source Addresses', 'Destination Address'
-    ]
-    
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    
-    if missing_columns:
-        st.error(f"Missing required columns: {', '.join(missing_columns)}")
-        return False
-    
-    return True
-
-def validate_wallets_list(df):
-    """Validate Wallets List format"""
-    required_columns = ['ID', 'Name']
-    
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    
-    if missing_columns:
-        st.error(f"Missing required columns in Wallets List: {', '.join(missing_columns)}")
-        return False
-    
-    return True
-
-def validate_vesting_pairs(df):
-    """Validate Vesting Wallet Pairs format"""
-    required_columns = ['Beneficiary Wallet', 'Originating Wallet']
-    
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    
-    if missing_columns:
-        st.error(f"Missing required columns in Vesting Wallet Pairs: {', '.join(missing_columns)}")
-        return False
-    
-    return True
-
-def validate_bitwave_file(df):
-    """Validate Bitwave Transactions Export format"""
-    required_columns = ['id', 'dateTime', 'walletId', 'amount']
-    
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    
-    if missing_columns:
-        st.error(f"Missing required columns in Bitwave Export: {', '.join(missing_columns)}")
-        return False
-    
-    return True
+@st.cache_data(show_spinner=False)
+def find_missing_columns(columns, kind):
+    """Return the columns of schema kind absent from columns; cached on the column-name tuple"""
+    required_columns = SCHEMA_REGISTRY[kind]
+    present_columns = set(columns)
+    if present_columns.issuperset(required_columns):
+        return []
+    return [col for col in required_columns if col not in present_columns]
+
+def validate(df, kind):
+    """Validate a file against its SCHEMA_REGISTRY entry; returns (is_valid, missing_columns) without UI calls"""
+    missing_columns = find_missing_columns(tuple(df.columns), kind)
+    return not missing_columns, missing_columns
+
+def missing_columns_message(kind, missing_columns):
+    """Error message for a file that failed validate()"""
+    location = f" in {SCHEMA_LABELS[kind]}" if SCHEMA_LABELS[kind] else ""
+    return f"Missing required columns{location}: {', '.join(missing_columns)}"
+
+def dataframe_to_csv_bytes(df):
+    """Serialize a DataFrame to CSV bytes exactly as df.to_csv(index=False) writes them"""
+    # Write straight into a byte buffer rather than building a str and encoding a second copy
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, encoding='utf-8')
+    return buffer.getvalue()
 
 def create_download_link(df, filename, link_text="Download CSV"):
     """Create a download link for a DataFrame"""
-    csv = df.to_csv(index=False)
-    csv_bytes = csv.encode('utf-8')
+    csv_bytes = dataframe_to_csv_bytes(df)
     
     return st.download_button(
         label=link_text,
@@ -141,6 +237,9 @@ def create_download_link(df, filename, link_text="Download CSV"):
         mime='text/csv'
     )
 
+# Rows of the Stage 1 table sent to the browser; the download has every row
+STAGE1_PREVIEW_ROWS = 1000
+
 # ============================================================================
 # STAGE PROCESSING FUNCTIONS
 # ============================================================================
@@ -148,28 +247,30 @@ def create_download_link(df, filename, link_text="Download CSV"):
 def process_stage_1(anchorage_df, wallets_df):
     """Stage 1: Vesting Outflows per Anchorage File"""
     try:
-        st.write(f"DEBUG: Total rows in Anchorage file: {len(anchorage_df)}")
+        # Handle null values in Type column FIRST; categorical codes turn the filters into int compares
+        anchorage_df['Type'] = anchorage_df['Type'].fillna('').astype('category')
         
-        # Handle null values in Type column FIRST
-        anchorage_df['Type'] = anchorage_df['Type'].fillna('')
+        is_balance_adjustment = anchorage_df['Type'] == 'Balance Adjustment'
         
-        st.write(f"DEBUG: First 10 Type values: {list(anchorage_df['Type'].head(10))}")
-        st.write(f"DEBUG: Unique transaction types: {sorted(anchorage_df['Type'].unique())}")
+        if not is_balance_adjustment.any():
+            is_balance_adjustment = anchorage_df['Type'].str.lower() == 'balance adjustment'
         
-        balance_adjustments = anchorage_df[anchorage_df['Type'] == 'Balance Adjustment'].copy()
-        
-        if balance_adjustments.empty:
-            balance_adjustments = anchorage_df[anchorage_df['Type'].str.lower() == 'balance adjustment'].copy()
-            st.write(f"DEBUG: Found {len(balance_adjustments)} balance adjustment transactions (case insensitive)")
+        # Only project the columns Stage 1 needs rather than copying the whole report
+        balance_adjustments = anchorage_df.loc[
+            is_balance_adjustment,
+            ['End Time', 'Source Addresses', 'Asset Quantity (Before Fee)', 'Value (USD)']
+        ]
         
         if balance_adjustments.empty:
             st.warning("No Balance Adjustment transactions found in the data.")
             return pd.DataFrame()
         
-        balance_adjustments['End Time'] = pd.to_datetime(balance_adjustments['End Time'])
-        balance_adjustments['Date'] = balance_adjustments['End Time'].dt.date
+        balance_adjustments = balance_adjustments.assign(**{
+            'Date': pd.to_datetime(balance_adjustments['End Time']).dt.date,
+            'Source Addresses': balance_adjustments['Source Addresses'].astype('category')
+        })
         
-        grouped = balance_adjustments.groupby(['Date', 'Source Addresses']).agg({
+        grouped = balance_adjustments.groupby(['Date', 'Source Addresses'], observed=True).agg({
             'Asset Quantity (Before Fee)': 'sum',
             'Value (USD)': 'sum'
         }).reset_index()
@@ -178,102 +279,99 @@ def process_stage_1(anchorage_df, wallets_df):
         grouped.loc[grouped['Asset Quantity (Before Fee)'] < 0, 'Asset Quantity (Before Fee)'] *= -1
         grouped.loc[grouped['Value (USD)'] < 0, 'Value (USD)'] *= -1
         
-        st.write(f"DEBUG: After grouping, found {len(grouped)} unique date/address combinations")
-        
-        grouped['Wallet Name'] = grouped['Source Addresses'].copy()
+        grouped['Wallet Name'] = grouped['Source Addresses'].astype(object)
         
         if not wallets_df.empty and 'Addresses' in wallets_df.columns and 'Name' in wallets_df.columns:
-            wallets_lookup = dict(zip(wallets_df['Addresses'], wallets_df['Name']))
-            for addr, name in wallets_lookup.items():
-                if pd.notna(addr):
-                    grouped.loc[grouped['Source Addresses'] == addr, 'Wallet Name'] = name
+            # Later rows win for repeated addresses, as with the old per-address assignment loop
+            wallets_lookup = (
+                wallets_df.dropna(subset=['Addresses'])
+                .drop_duplicates(subset='Addresses', keep='last')
+                .set_index('Addresses')['Name']
+                .to_dict()
+            )
+            # Single hashed lookup per row; unknown addresses keep the raw address
+            grouped['Wallet Name'] = grouped['Wallet Name'].map(wallets_lookup).fillna(grouped['Wallet Name'])
         
         result = grouped[['Date', 'Wallet Name', 'Asset Quantity (Before Fee)', 'Value (USD)']]
         result = result.sort_values(['Date', 'Wallet Name'])
         
-        st.write(f"DEBUG: Final result has {len(result)} rows")
         return result
         
     except Exception as e:
         st.error(f"Error in Stage 1 processing: {str(e)}")
         return pd.DataFrame()
 
-def get_withdrawal_account_id(wallet_name, wallets_df, error_log):
-    """Get account ID for withdrawal row"""
-    try:
-       # Try multiple search patterns for vesting tokens wallet
-        search_patterns = [
-            wallet_name + " vesting tokens",  # Try with full name first
-            wallet_name.replace("Aptos ", "") + " vesting tokens" if wallet_name.startswith("Aptos ") else wallet_name + " vesting tokens"  # Try without "Aptos"
-        ]
-        
-        match = pd.DataFrame()  # Start with empty match
-        for search_name in search_patterns:
-            match = wallets_df[wallets_df['Name'] == search_name]
-            if not match.empty:
-                break  # Found a match, stop searching
-        
-        if match.empty:
-            error_msg = f"{wallet_name} is missing a vesting tokens wallet"
-            error_log.append({
-                'Wallet Name': wallet_name,
-                'Error Type': 'Missing Vesting Tokens Wallet',
-                'Error Message': error_msg
-            })
-            return None
-        
-        return match.iloc[0]['ID']
-        
-    except Exception as e:
-        error_msg = f"Error finding withdrawal account ID for {wallet_name}: {str(e)}"
-        error_log.append({
-            'Wallet Name': wallet_name,
-            'Error Type': 'Withdrawal Account ID Error',
-            'Error Message': error_msg
-        })
-        return None
-
-def get_deposit_account_id(wallet_name, wallets_df, vesting_pairs_df, error_log):
-    """Get account ID for deposit row"""
-    try:
-        # Find originating wallet in vesting pairs
-        originating_match = vesting_pairs_df[vesting_pairs_df['Originating Wallet'] == wallet_name]
-        
-        if originating_match.empty:
-            error_msg = f"No Originating Wallet Match in the Vesting Wallet Pairs table for {wallet_name}"
-            error_log.append({
-                'Wallet Name': wallet_name,
-                'Error Type': 'No Originating Wallet Match',
-                'Error Message': error_msg
-            })
-            return None
-        
-        beneficiary_wallet = originating_match.iloc[0]['Beneficiary Wallet']
-        
-        # Find beneficiary wallet in wallets list
-        beneficiary_match = wallets_df[wallets_df['Name'] == beneficiary_wallet]
-        
-        if beneficiary_match.empty:
-            error_msg = f"No Beneficiary Wallet Match in the Wallets list for {beneficiary_wallet}"
-            error_log.append({
-                'Wallet Name': wallet_name,
-                'Error Type': 'No Beneficiary Wallet Match',
-                'Error Message': error_msg,
-                'Beneficiary Wallet': beneficiary_wallet
-            })
-            return None
-        
-        return beneficiary_match.iloc[0]['ID']
-        
-    except Exception as e:
-        error_msg = f"Error finding deposit account ID for {wallet_name}: {str(e)}"
-        st.error(error_msg)
-        error_log.append({
-            'Wallet Name': wallet_name,
-            'Error Type': 'Deposit Account ID Error',
-            'Error Message': error_msg
-        })
-        return None
+def build_reference_lookups(wallets_df, vesting_pairs_df):
+    """Build hash lookups over the reference tables (first match wins, as with iloc[0])"""
+    named_wallets = wallets_df.dropna(subset=['Name']).drop_duplicates(subset='Name', keep='first')
+    unique_ids = wallets_df.drop_duplicates(subset='ID', keep='first')
+    pairs = vesting_pairs_df.dropna(subset=['Originating Wallet']).drop_duplicates(subset='Originating Wallet', keep='first')
+    
+    return {
+        'name_to_id': named_wallets.set_index('Name')['ID'].to_dict(),
+        'id_to_name': unique_ids.set_index('ID')['Name'].to_dict(),
+        'originating_to_beneficiary': pairs.set_index('Originating Wallet')['Beneficiary Wallet'].to_dict()
+    }
+
+def get_reference_lookups(wallets_df, vesting_pairs_df):
+    """Get reference lookups, rebuilding them only when the reference tables change"""
+    key = (
+        int(pd.util.hash_pandas_object(wallets_df, index=False).sum()),
+        int(pd.util.hash_pandas_object(vesting_pairs_df, index=False).sum())
+    )
+    cached = st.session_state.get('reference_lookups')
+    if cached is None or cached[0] != key:
+        cached = (key, build_reference_lookups(wallets_df, vesting_pairs_df))
+        st.session_state['reference_lookups'] = cached
+    return cached[1]
+
+# Bitwave transaction import columns, in output order
+TRANSACTION_COLUMNS = [
+    'id', 'remoteContactId', 'amount', 'amountTicker', 'cost', 'costTicker',
+    'fee', 'feeTicker', 'time', 'blockchainId', 'memo', 'transactionType',
+    'accountId', 'contactId', 'categoryId', 'taxExempt', 'tradeId',
+    'description', 'fromAddress', 'toAddress', 'groupId'
+]
+
+def build_transaction_frame(index, **values):
+    """Build Bitwave transaction import rows for the given index; unset columns are blank"""
+    return pd.DataFrame({col: values.get(col, '') for col in TRANSACTION_COLUMNS}, index=index)
+
+def format_noon_times(dates):
+    """Format dates as 12:00 PM timestamps and as the %m%d%y blockchain ID suffix"""
+    timestamps = pd.to_datetime(dates) + pd.Timedelta(hours=12)
+    return timestamps.dt.strftime('%m/%d/%Y %H:%M:%S'), timestamps.dt.strftime('%m%d%y')
+
+def build_stage2_error_log(wallet_names, withdrawal_ids, has_originating, beneficiary_wallets, deposit_ids):
+    """Build the Stage 2 error log for rows whose accounts could not be resolved"""
+    wallet_names = wallet_names.astype(str)
+    
+    missing_withdrawal = withdrawal_ids.isna()
+    missing_originating = ~has_originating
+    missing_beneficiary = has_originating & deposit_ids.isna()
+    
+    withdrawal_errors = pd.DataFrame({
+        'Wallet Name': wallet_names[missing_withdrawal],
+        'Error Type': 'Missing Vesting Tokens Wallet',
+        'Error Message': wallet_names[missing_withdrawal] + " is missing a vesting tokens wallet"
+    })
+    originating_errors = pd.DataFrame({
+        'Wallet Name': wallet_names[missing_originating],
+        'Error Type': 'No Originating Wallet Match',
+        'Error Message': "No Originating Wallet Match in the Vesting Wallet Pairs table for " + wallet_names[missing_originating]
+    })
+    beneficiary_errors = pd.DataFrame({
+        'Wallet Name': wallet_names[missing_beneficiary],
+        'Error Type': 'No Beneficiary Wallet Match',
+        'Error Message': "No Beneficiary Wallet Match in the Wallets list for " + beneficiary_wallets[missing_beneficiary].astype(str)
+    })
+    # The Beneficiary Wallet column only appears in the log when such an error occurred
+    if missing_beneficiary.any():
+        beneficiary_errors['Beneficiary Wallet'] = beneficiary_wallets[missing_beneficiary]
+    
+    # Stable sort on the Stage 1 row position keeps withdrawal errors ahead of deposit errors per row
+    error_log = pd.concat([withdrawal_errors, originating_errors, beneficiary_errors])
+    return error_log.sort_index(kind='stable').reset_index(drop=True)
 
 def process_stage_2(stage1_df, wallets_df, vesting_pairs_df):
     """Stage 2: Creating Vesting Transfers to Beneficiary Wallets"""
@@ -282,170 +380,144 @@ def process_stage_2(stage1_df, wallets_df, vesting_pairs_df):
             st.error("No Stage 1 data available for Stage 2 processing")
             return pd.DataFrame()
         
-        output_rows = []
-        error_log = []
+        stage1_df = stage1_df.reset_index(drop=True)
+        wallet_names = stage1_df['Wallet Name']
+        
+        lookups = get_reference_lookups(wallets_df, vesting_pairs_df)
+        name_to_id = lookups['name_to_id']
+        originating_to_beneficiary = lookups['originating_to_beneficiary']
+        
+        # Withdrawal account: try the full name first, then without the "Aptos " prefix
+        withdrawal_ids = (wallet_names + " vesting tokens").map(name_to_id)
+        stripped_names = wallet_names.str.removeprefix('Aptos ') + " vesting tokens"
+        withdrawal_ids = withdrawal_ids.fillna(stripped_names.map(name_to_id))
+        
+        # Deposit account: originating wallet -> beneficiary wallet -> account ID
+        has_originating = wallet_names.isin(list(originating_to_beneficiary))
+        beneficiary_wallets = wallet_names.map(originating_to_beneficiary)
+        deposit_ids = beneficiary_wallets.map(name_to_id)
+        
+        # Two IDs per Stage 1 row (withdrawal, then deposit), allocated even if a row is skipped
+        unique_ids = id_generator.get_ids(2 * len(stage1_df))
+        
+        # Format time as 12:00 PM
+        time_formatted, date_suffix = format_noon_times(stage1_df['Date'])
+        
+        stage2_values = {
+            'amount': stage1_df['Asset Quantity (Before Fee)'],
+            'amountTicker': 'APT',
+            'cost': stage1_df['Value (USD)'],
+            'costTicker': 'USD',
+            'time': time_formatted,
+            'taxExempt': 'FALSE',
+            'description': 'vesting distribution per Anchorage report'
+        }
+        
+        withdrawals = build_transaction_frame(
+            stage1_df.index[withdrawal_ids.notna()],
+            id=pd.Series(unique_ids[0::2]),
+            blockchainId=withdrawal_ids.astype(str) + ".vestingdistribute." + date_suffix,
+            transactionType='withdrawal',
+            accountId=withdrawal_ids,
+            **stage2_values
+        )
         
-        for _, row in stage1_df.iterrows():
-            date = row['Date']
-            wallet_name = row['Wallet Name']
-            amount = row['Asset Quantity (Before Fee)']
-            cost = row['Value (USD)']
-            
-            # Format time as 12:00 PM
-            time_formatted = datetime.combine(date, datetime.min.time().replace(hour=12)).strftime('%m/%d/%Y %H:%M:%S')
-            
-            # Get unique IDs for both rows
-            withdrawal_id = id_generator.get_next_id()
-            deposit_id = id_generator.get_next_id()
-            
-            # Create withdrawal row
-            withdrawal_account_id = get_withdrawal_account_id(wallet_name, wallets_df, error_log)
-            if withdrawal_account_id:
-                blockchain_id = f"{withdrawal_account_id}.vestingdistribute.{date.strftime('%m%d%y')}"
-                
-                withdrawal_row = {
-                    'id': withdrawal_id,
-                    'remoteContactId': '',
-                    'amount': amount,
-                    'amountTicker': 'APT',
-                    'cost': cost,
-                    'costTicker': 'USD',
-                    'fee': '',
-                    'feeTicker': '',
-                    'time': time_formatted,
-                    'blockchainId': blockchain_id,
-                    'memo': '',
-                    'transactionType': 'withdrawal',
-                    'accountId': withdrawal_account_id,
-                    'contactId': '',
-                    'categoryId': '',
-                    'taxExempt': 'FALSE',
-                    'tradeId': '',
-                    'description': 'vesting distribution per Anchorage report',
-                    'fromAddress': '',
-                    'toAddress': '',
-                    'groupId': ''
-                }
-                output_rows.append(withdrawal_row)
-            
-            # Create deposit row
-            deposit_account_id = get_deposit_account_id(wallet_name, wallets_df, vesting_pairs_df, error_log)
-            if deposit_account_id:
-                blockchain_id = f"{deposit_account_id}.vestingdistribute.{date.strftime('%m%d%y')}"
-                
-                deposit_row = {
-                    'id': deposit_id,
-                    'remoteContactId': '',
-                    'amount': amount,
-                    'amountTicker': 'APT',
-                    'cost': cost,
-                    'costTicker': 'USD',
-                    'fee': '',
-                    'feeTicker': '',
-                    'time': time_formatted,
-                    'blockchainId': blockchain_id,
-                    'memo': '',
-                    'transactionType': 'deposit',
-                    'accountId': deposit_account_id,
-                    'contactId': '',
-                    'categoryId': '',
-                    'taxExempt': 'FALSE',
-                    'tradeId': '',
-                    'description': 'vesting distribution per Anchorage report',
-                    'fromAddress': '',
-                    'toAddress': '',
-                    'groupId': ''
-                }
-                output_rows.append(deposit_row)
+        deposits = build_transaction_frame(
+            stage1_df.index[deposit_ids.notna()],
+            id=pd.Series(unique_ids[1::2]),
+            blockchainId=deposit_ids.astype(str) + ".vestingdistribute." + date_suffix,
+            transactionType='deposit',
+            accountId=deposit_ids,
+            **stage2_values
+        )
         
         # Store errors in session state for download
-        if error_log:
-            st.session_state['stage2_errors'] = pd.DataFrame(error_log)
+        error_log = build_stage2_error_log(wallet_names, withdrawal_ids, has_originating, beneficiary_wallets, deposit_ids)
+        if not error_log.empty:
+            st.session_state['stage2_errors'] = error_log
         
-        return pd.DataFrame(output_rows)
+        # Interleave withdrawal/deposit rows per Stage 1 row, as before
+        output = pd.concat([withdrawals, deposits])
+        return output.sort_index(kind='stable').reset_index(drop=True)
         
     except Exception as e:
         st.error(f"Error in Stage 2 processing: {str(e)}")
         return pd.DataFrame()
-
-def get_stage2_deposit_amount(stage2_df, account_id, date):
-    """Get the deposit amount from Stage 2 for matching account and date"""
-    try:
-        # Filter for deposit transactions with matching account ID
-        deposits = stage2_df[
-            (stage2_df['transactionType'] == 'deposit') & 
-            (stage2_df['accountId'] == account_id)
-        ]
-        
-        if deposits.empty:
-            return None
-        
-        # Find matching date (convert stage2 time to date)
-        for _, deposit_row in deposits.iterrows():
-            deposit_date = datetime.strptime(deposit_row['time'], '%m/%d/%Y %H:%M:%S').date()
-            if deposit_date == date:
-                return deposit_row['amount']
-        
-        return None
-        
-    except Exception as e:
-        st.error(f"Error getting Stage 2 deposit amount: {str(e)}")
-        return None
+    finally:
+        id_generator.flush()
+
+def build_stage2_deposits(stage2_df):
+    """Get Stage 2 deposit amounts per account ID and date (first match wins)"""
+    deposits = stage2_df[stage2_df['transactionType'] == 'deposit']
+    deposit_dates = pd.to_datetime(deposits['time'], format='%m/%d/%Y %H:%M:%S', errors='coerce').dt.date
+    deposits = pd.DataFrame({
+        'accountId': deposits['accountId'],
+        'Date': deposit_dates,
+        'stage2_amount': deposits['amount']
+    })
+    return deposits.drop_duplicates(subset=['accountId', 'Date'], keep='first')
     
-def calculate_bitwave_amount(bitwave_df, account_id, date, stage2_amount):
+def build_bitwave_index(bitwave_df):
+    """Group Bitwave transactions by wallet as time-sorted arrays for window searches
+    
+    Expects dateTime to be parsed already (see load_csv_file's date_column).
+    """
+    transactions = bitwave_df[['id', 'amount', 'dateTime']].assign(
+        walletId=bitwave_df['walletId'].astype('category'),
+        position=np.arange(len(bitwave_df))
+    )
+    
+    transactions = transactions.dropna(subset=['dateTime']).sort_values('dateTime', kind='stable')
+    return {
+        wallet_id: (
+            group['dateTime'].to_numpy(),
+            group['amount'].to_numpy(),
+            group['id'].to_numpy(),
+            group['position'].to_numpy()
+        )
+        for wallet_id, group in transactions.groupby('walletId', sort=False, observed=True)
+    }
+
+def calculate_bitwave_amount(bitwave_index, account_id, date, stage2_amount, matched_transactions):
     """Calculate amount from Bitwave data based on criteria"""
     try:
-        st.write(f"DEBUG BITWAVE: Looking for account_id={account_id}, date={date}, stage2_amount={stage2_amount}")
+        # Look up Bitwave data for matching wallet ID
+        wallet_transactions = bitwave_index.get(account_id)
 
-        # Filter Bitwave data for matching wallet ID
-        wallet_transactions = bitwave_df[bitwave_df['walletId'] == account_id].copy()
-        st.write(f"DEBUG BITWAVE: Found {len(wallet_transactions)} transactions for wallet {account_id}")
+        # Runs once per candidate, so only build the debug messages when debugging
+        if st.session_state.get('debug'):
+            st.write(f"DEBUG BITWAVE: Looking for account_id={account_id}, date={date}, stage2_amount={stage2_amount}")
+            st.write(f"DEBUG BITWAVE: Found {0 if wallet_transactions is None else len(wallet_transactions[0])} transactions for wallet {account_id}")
 
-        if wallet_transactions.empty:
+        if wallet_transactions is None:
             return None
 
+        times, amounts, ids, positions = wallet_transactions
+
         # Convert date to datetime for comparison
         base_date = datetime.combine(date, datetime.min.time())
         start_date = base_date - timedelta(days=20)
         end_date   = base_date + timedelta(days=20)
 
-        # Parse timestamps and normalize to timezone-naive
-        wallet_transactions['dateTime'] = pd.to_datetime(
-            wallet_transactions['dateTime'], errors='coerce'
-        )
-
-        # If timezone-aware, drop tz info for comparison
-        if getattr(wallet_transactions['dateTime'].dt, "tz", None) is not None:
-            wallet_transactions['dateTime'] = wallet_transactions['dateTime'].dt.tz_convert(None)
-
-        # Keep rows within ±20 days of base_date (inclusive)
-        date_filtered = wallet_transactions[
-            (wallet_transactions['dateTime'] >= start_date) &
-            (wallet_transactions['dateTime'] <= end_date)
-        ]
-
-        if date_filtered.empty:
-            return None
+        # Keep rows within ±20 days of base_date (inclusive) via binary search on sorted times
+        lo = times.searchsorted(pd.Timestamp(start_date).to_datetime64(), side='left')
+        hi = times.searchsorted(pd.Timestamp(end_date).to_datetime64(), side='right')
 
         # Filter for amounts greater than Stage 2 deposit amount
-        amount_filtered = date_filtered[date_filtered['amount'] > stage2_amount]
-        if amount_filtered.empty:
+        qualifying = np.flatnonzero(amounts[lo:hi] > stage2_amount)
+        if qualifying.size == 0:
             return None
 
-        # Use the first matching transaction
-        bitwave_amount = amount_filtered.iloc[0]['amount']
+        # Use the first matching transaction in export order
+        match = lo + qualifying[positions[lo:hi][qualifying].argmin()]
+        bitwave_amount = amounts[match]
         calculated_amount = bitwave_amount - stage2_amount
 
-        # Store the matched bitwave transaction for Stage 4
-        if 'stage3_matched_transactions' not in st.session_state:
-            st.session_state['stage3_matched_transactions'] = []
-
-        st.session_state['stage3_matched_transactions'].append({
-            'id': amount_filtered.iloc[0]['id'],
-            'bitwave_amount': bitwave_amount,
-            'stage2_amount': stage2_amount,
-            'calculated_amount': calculated_amount
-        })
+        # Record the matched bitwave transaction for Stage 4
+        matched_transactions['id'].append(ids[match])
+        matched_transactions['bitwave_amount'].append(bitwave_amount)
+        matched_transactions['stage2_amount'].append(stage2_amount)
+        matched_transactions['calculated_amount'].append(calculated_amount)
 
         return calculated_amount
 
@@ -454,105 +526,84 @@ def calculate_bitwave_amount(bitwave_df, account_id, date, stage2_amount):
         return None
 
 
-def get_wallet_name_from_id(account_id, wallets_df):
-    """Get wallet name from account ID"""
-    try:
-        match = wallets_df[wallets_df['ID'] == account_id]
-        if not match.empty:
-            return match.iloc[0]['Name']
-        return f"Unknown Wallet ({account_id})"
-    except:
-        return f"Unknown Wallet ({account_id})"
-
 def process_stage_3(stage1_df, stage2_df, bitwave_df, wallets_df, vesting_pairs_df):
     """Stage 3: Vesting Staking Rewards Import"""
     try:
-        st.write(f"DEBUG: Stage 1 has {len(stage1_df)} rows")
-        st.write(f"DEBUG: Stage 2 has {len(stage2_df)} rows") 
-        st.write(f"DEBUG: Bitwave has {len(bitwave_df)} rows")
+        debug_write(f"DEBUG: Stage 1 has {len(stage1_df)} rows")
+        debug_write(f"DEBUG: Stage 2 has {len(stage2_df)} rows") 
+        debug_write(f"DEBUG: Bitwave has {len(bitwave_df)} rows")
         
         if stage1_df.empty:
             st.error("No Stage 1 data available for Stage 3 processing")
             return pd.DataFrame(), pd.DataFrame()
         
-        output_rows = []
-        display_rows = []
-        
-        for _, row in stage1_df.iterrows():
-            date = row['Date']
-            wallet_name = row['Wallet Name']
-            
-            # Get deposit account ID (same logic as Stage 2 deposit)
-            error_log = []
-            account_id = get_deposit_account_id(wallet_name, wallets_df, vesting_pairs_df, error_log)
-            if not account_id:
-                continue
-            
-            # Find corresponding Stage 2 deposit amount
-            stage2_deposit_amount = get_stage2_deposit_amount(stage2_df, account_id, date)
-            if stage2_deposit_amount is None:
-                continue
-            
-            # Calculate amount from Bitwave data
-            calculated_amount = calculate_bitwave_amount(
-                bitwave_df, account_id, date, stage2_deposit_amount
+        lookups = get_reference_lookups(wallets_df, vesting_pairs_df)
+        bitwave_index = build_bitwave_index(bitwave_df)
+        matched_transactions = {'id': [], 'bitwave_amount': [], 'stage2_amount': [], 'calculated_amount': []}
+        
+        # Get deposit account ID (same logic as Stage 2 deposit)
+        beneficiary_wallets = stage1_df['Wallet Name'].map(lookups['originating_to_beneficiary'])
+        stage1_accounts = pd.DataFrame({
+            'Date': stage1_df['Date'].to_numpy(),
+            'accountId': beneficiary_wallets.map(lookups['name_to_id']).to_numpy()
+        }).dropna(subset=['accountId'])
+        
+        # Find corresponding Stage 2 deposit amount
+        candidates = stage1_accounts.merge(build_stage2_deposits(stage2_df), on=['accountId', 'Date'], how='left')
+        candidates = candidates.dropna(subset=['stage2_amount'])
+        
+        # Calculate amount from Bitwave data
+        calculated_amounts = [
+            calculate_bitwave_amount(bitwave_index, account_id, date, stage2_amount, matched_transactions)
+            for account_id, date, stage2_amount in zip(
+                candidates['accountId'], candidates['Date'], candidates['stage2_amount']
             )
-            
-            if calculated_amount is None or calculated_amount <= 0:
-                continue
-            
-            # Format time as 12:00 PM
-            time_formatted = datetime.combine(date, datetime.min.time().replace(hour=12)).strftime('%m/%d/%Y %H:%M:%S')
-            
-            # Get unique ID
-            unique_id = id_generator.get_next_id()
-            
-            # Create blockchain ID
-            blockchain_id = f"{account_id}.vestingstakingrewards.{date.strftime('%m%d%y')}"
-            
-            # Create output row
-            output_row = {
-                'id': unique_id,
-                'remoteContactId': '',
-                'amount': calculated_amount,
-                'amountTicker': 'APT',
-                'cost': '',
-                'costTicker': '',
-                'fee': '',
-                'feeTicker': '',
-                'time': time_formatted,
-                'blockchainId': blockchain_id,
-                'memo': '',
-                'transactionType': 'deposit',
-                'accountId': account_id,
-                'contactId': 'nFc4OUI5w6wSa6zFKQVj.526',
-                'categoryId': 'nFc4OUI5w6wSa6zFKQVj.265',
-                'taxExempt': 'FALSE',
-                'tradeId': '',
-                'description': 'staking reward from vesting distribution per Anchorage report',
-                'fromAddress': '',
-                'toAddress': '',
-                'groupId': ''
-            }
-            output_rows.append(output_row)
-            
-            # Create display row (get wallet name from account ID)
-            display_wallet_name = get_wallet_name_from_id(account_id, wallets_df)
-            display_row = {
-                'Date': date,
-                'Wallet Name': display_wallet_name,
-                'Amount': calculated_amount
-            }
-            display_rows.append(display_row)
+        ]
+        candidates['amount'] = pd.Series(calculated_amounts, index=candidates.index, dtype='float64')
+        matched = candidates[candidates['amount'] > 0].reset_index(drop=True)
+        
+        # Format time as 12:00 PM
+        time_formatted, date_suffix = format_noon_times(matched['Date'])
+        
+        # Get unique IDs
+        unique_ids = id_generator.get_ids(len(matched))
+        
+        output_df = build_transaction_frame(
+            matched.index,
+            id=pd.Series(unique_ids, dtype=object),
+            amount=matched['amount'],
+            amountTicker='APT',
+            time=time_formatted,
+            blockchainId=matched['accountId'].astype(str) + ".vestingstakingrewards." + date_suffix,
+            transactionType='deposit',
+            accountId=matched['accountId'],
+            contactId='nFc4OUI5w6wSa6zFKQVj.526',
+            categoryId='nFc4OUI5w6wSa6zFKQVj.265',
+            taxExempt='FALSE',
+            description='staking reward from vesting distribution per Anchorage report'
+        )
+        
+        # Display rows are a projection of the CSV rows (wallet name from account ID)
+        wallet_names = output_df['accountId'].map(lookups['id_to_name'])
+        display_df = pd.DataFrame({
+            'Date': matched['Date'],
+            'Wallet Name': wallet_names.fillna("Unknown Wallet (" + output_df['accountId'].astype(str) + ")"),
+            'Amount': output_df['amount']
+        })
+        
+        debug_write(f"DEBUG: Generated {len(output_df)} output rows")
+        debug_write(f"DEBUG: Generated {len(display_df)} display rows")
         
-        st.write(f"DEBUG: Generated {len(output_rows)} output rows")
-        st.write(f"DEBUG: Generated {len(display_rows)} display rows")
+        # Store the matched bitwave transactions for Stage 4
+        st.session_state['stage3_matched_transactions'] = pd.DataFrame(matched_transactions)
         
-        return pd.DataFrame(output_rows), pd.DataFrame(display_rows)
+        return output_df, display_df
         
     except Exception as e:
         st.error(f"Error in Stage 3 processing: {str(e)}")
         return pd.DataFrame(), pd.DataFrame()
+    finally:
+        id_generator.flush()
 
 def process_stage_4():
     """Stage 4: Ignore synced in vesting/staking transactions"""
@@ -561,15 +612,12 @@ def process_stage_4():
             st.warning("No Stage 3 transactions found. Please run Stage 3 first.")
             return pd.DataFrame()
         
-        output_rows = []
+        matched_transactions = st.session_state['stage3_matched_transactions']
         
-        for transaction in st.session_state['stage3_matched_transactions']:
-            output_rows.append({
-                'transactionID': transaction['id'],
-                'action': 'ignore'
-            })
-        
-        return pd.DataFrame(output_rows)
+        return pd.DataFrame({
+            'transactionID': matched_transactions['id'],
+            'action': 'ignore'
+        })
         
     except Exception as e:
         st.error(f"Error in Stage 4 processing: {str(e)}")
@@ -579,35 +627,35 @@ def process_stage_4():
 # SESSION STATE INITIALIZATION
 # ============================================================================
 
+# Session keys seeded on first run; the empty frames are never mutated, only replaced
+_DEFAULTS = {
+    'debug': bool(os.environ.get('APTOS_DEBUG')),
+    'wallets_list': pd.DataFrame(),
+    'vesting_pairs': pd.DataFrame(),
+    'stage1_data': pd.DataFrame(),
+    'stage2_data': pd.DataFrame(),
+    'stage3_csv_data': pd.DataFrame(),
+    'stage3_display_data': pd.DataFrame(),
+    'stage4_data': pd.DataFrame(),
+}
+
 def initialize_session_state():
     """Initialize session state variables"""
-    if 'wallets_list' not in st.session_state:
-        st.session_state['wallets_list'] = pd.DataFrame()
-    if 'vesting_pairs' not in st.session_state:
-        st.session_state['vesting_pairs'] = pd.DataFrame()
-    if 'stage1_data' not in st.session_state:
-        st.session_state['stage1_data'] = pd.DataFrame()
-    if 'stage2_data' not in st.session_state:
-        st.session_state['stage2_data'] = pd.DataFrame()
-    if 'stage3_csv_data' not in st.session_state:
-        st.session_state['stage3_csv_data'] = pd.DataFrame()
-    if 'stage3_display_data' not in st.session_state:
-        st.session_state['stage3_display_data'] = pd.DataFrame()
-    if 'stage4_data' not in st.session_state:
-        st.session_state['stage4_data'] = pd.DataFrame()
+    for key, value in _DEFAULTS.items():
+        st.session_state.setdefault(key, value)
 
 def load_initial_data():
     """Load initial reference data files"""
     try:
         # Load wallets list if exists
         if os.path.exists('data/wallets_list.csv'):
-            wallets_df = pd.read_csv('data/wallets_list.csv')
+            wallets_df = read_reference_csv('data/wallets_list.csv', os.path.getmtime('data/wallets_list.csv'))
             if not wallets_df.empty and len(wallets_df.columns) > 3:
                 st.session_state['wallets_list'] = wallets_df
         
         # Load vesting pairs if exists  
         if os.path.exists('data/vesting_wallet_pairs.csv'):
-            pairs_df = pd.read_csv('data/vesting_wallet_pairs.csv')
+            pairs_df = read_reference_csv('data/vesting_wallet_pairs.csv', os.path.getmtime('data/vesting_wallet_pairs.csv'))
             if not pairs_df.empty and len(pairs_df.columns) >= 2:
                 st.session_state['vesting_pairs'] = pairs_df
                 
@@ -663,25 +711,39 @@ def main():
         uploaded_anchorage = st.file_uploader("Upload Anchorage Transaction Report", type=['csv'], key='anchorage_upload')
         
         if uploaded_anchorage:
-            anchorage_df = load_csv_file(uploaded_anchorage)
+            anchorage_df = load_csv_file(uploaded_anchorage, usecols=ANCHORAGE_COLS)
+            
+            is_valid = False
+            if anchorage_df is not None:
+                is_valid, missing_columns = validate(anchorage_df, 'anchorage')
+                if not is_valid:
+                    st.error(missing_columns_message('anchorage', missing_columns))
             
-            if anchorage_df is not None and validate_anchorage_file(anchorage_df):
+            if is_valid:
                 if st.button("Process Stage 1", key='process_stage1'):
                     with st.spinner("Processing Stage 1..."):
-                        st.write("DEBUG: Button clicked, starting processing...")
-                        st.write(f"DEBUG: Anchorage file has {len(anchorage_df)} rows")
-                        st.write(f"DEBUG: Wallets list has {len(st.session_state['wallets_list'])} rows")
+                        debug_write("DEBUG: Button clicked, starting processing...")
+                        debug_write(f"DEBUG: Anchorage file has {len(anchorage_df)} rows")
+                        debug_write(f"DEBUG: Wallets list has {len(st.session_state['wallets_list'])} rows")
                         
                         stage1_result = process_stage_1(anchorage_df, st.session_state['wallets_list'])
                         
-                        st.write(f"DEBUG: Function returned {len(stage1_result)} rows")
+                        debug_write(f"DEBUG: Function returned {len(stage1_result)} rows")
                         st.session_state['stage1_data'] = stage1_result
                         st.success("Stage 1 processing completed!")
         
         # Display results
         if 'stage1_data' in st.session_state and not st.session_state['stage1_data'].empty:
             st.subheader("📋 Stage 1 Results")
-            st.dataframe(st.session_state['stage1_data'], use_container_width=True)
+            st.dataframe(
+                st.session_state['stage1_data'].iloc[:STAGE1_PREVIEW_ROWS],
+                use_container_width=True,
+                hide_index=True,
+                height=400
+            )
+            
+            if len(st.session_state['stage1_data']) > STAGE1_PREVIEW_ROWS:
+                st.info(f"Showing first {STAGE1_PREVIEW_ROWS} rows. Download CSV for complete data.")
             
             # Download button
             create_download_link(
@@ -692,7 +754,7 @@ def main():
         
         # Debug info
         if 'stage1_data' in st.session_state:
-            st.write(f"Debug: Stage 1 data has {len(st.session_state['stage1_data'])} rows")
+            debug_write(f"Debug: Stage 1 data has {len(st.session_state['stage1_data'])} rows")
     
     # Stage 2 Tab
     with tab2:
@@ -719,7 +781,7 @@ def main():
         if not st.session_state['stage2_data'].empty:
             st.subheader("📋 Stage 2 Results")
             st.info(f"Generated {len(st.session_state['stage2_data'])} transaction rows")
-            st.dataframe(st.session_state['stage2_data'].head(10), use_container_width=True)
+            st.dataframe(st.session_state['stage2_data'].iloc[:10], use_container_width=True, hide_index=True)
             
             if len(st.session_state['stage2_data']) > 10:
                 st.info("Showing first 10 rows. Download CSV for complete data.")
@@ -756,9 +818,15 @@ def main():
         elif uploaded_bitwave is None:
             st.warning("⚠️ Please upload Bitwave Transactions Export")
         else:
-            bitwave_df = load_csv_file(uploaded_bitwave)
+            bitwave_df = load_csv_file(uploaded_bitwave, date_column='dateTime', usecols=BITWAVE_COLS)
+            
+            is_valid = False
+            if bitwave_df is not None:
+                is_valid, missing_columns = validate(bitwave_df, 'bitwave')
+                if not is_valid:
+                    st.error(missing_columns_message('bitwave', missing_columns))
             
-            if bitwave_df is not None and validate_bitwave_file(bitwave_df):
+            if is_valid:
                 if st.button("Process Stage 3", key='process_stage3'):
                     with st.spinner("Processing Stage 3..."):
                         stage3_csv, stage3_display = process_stage_3(
@@ -797,7 +865,7 @@ def main():
     with tab4:
         st.header("🚫 Stage 4 - Ignore Synced in Vesting/Staking Transactions")
         
-        if 'stage3_matched_transactions' not in st.session_state or not st.session_state.get('stage3_matched_transactions'):
+        if 'stage3_matched_transactions' not in st.session_state or st.session_state['stage3_matched_transactions'].empty:
             st.warning("⚠️ Please complete Stage 3 first to generate transaction IDs")
         else:
             if st.button("Process Stage 4", key='process_stage4'):
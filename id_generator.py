@@ -3,55 +3,73 @@ import streamlit as st
 from datetime import datetime
 import os
 import json
+import numpy as np
 
 class UniqueIDGenerator:
     """Generates unique IDs that are never repeated across sessions"""
     
     def __init__(self):
-        self.counter_file = "data/id_counter.json"
+        # Shared with app.UniqueIDGenerator, which reads and writes the same plain-integer file
+        self.counter_file = "data/id_counter.txt"
+        self.legacy_counter_file = "data/id_counter.json"
+        self._dir_ready = False
         self.load_counter()
     
     def load_counter(self):
         """Load the current counter from file, or start at 1 if file doesn't exist"""
         if 'id_counter' not in st.session_state:
             try:
-                if os.path.exists(self.counter_file):
-                    with open(self.counter_file, 'r') as f:
-                        data = json.load(f)
-                        st.session_state['id_counter'] = data.get('counter', 1)
-                else:
-                    st.session_state['id_counter'] = 1
+                st.session_state['id_counter'] = self._read_counter()
             except:
                 st.session_state['id_counter'] = 1
     
+    def _read_counter(self):
+        """Read the saved counter, opening files directly instead of checking they exist first"""
+        try:
+            with open(self.counter_file, 'r') as f:
+                return int(f.read().strip())
+        except FileNotFoundError:
+            pass
+        
+        try:
+            # Counter saved by older versions as {"counter": N}
+            with open(self.legacy_counter_file, 'r') as f:
+                return json.load(f).get('counter', 1)
+        except FileNotFoundError:
+            return 1
+    
     def save_counter(self):
-        """Save the current counter to file"""
+        """Save the current counter to file as a plain integer"""
         try:
-            os.makedirs(os.path.dirname(self.counter_file), exist_ok=True)
+            if not self._dir_ready:
+                os.makedirs(os.path.dirname(self.counter_file), exist_ok=True)
+                self._dir_ready = True
             with open(self.counter_file, 'w') as f:
-                json.dump({'counter': st.session_state['id_counter']}, f)
+                f.write(str(st.session_state['id_counter']))
         except:
             pass  # If we can't save, we'll just continue with session state
     
     def get_next_id(self):
         """Get the next unique ID and increment counter"""
-        current_id = st.session_state['id_counter']
-        st.session_state['id_counter'] += 1
+        return str(self.get_multiple_ids(1)[0])
+    
+    def get_multiple_ids(self, count):
+        """Get multiple unique IDs at once, persisting the counter a single time"""
+        if count == 0:
+            return np.array([], dtype=str)  # np.char.zfill fails on empty arrays
+        
+        self.load_counter()  # The cached instance may be shared with a new session
+        start = st.session_state['id_counter']
+        st.session_state['id_counter'] = start + count
         self.save_counter()
         
-        # Create a unique ID using timestamp and counter
+        # Create unique IDs using one timestamp and the reserved counter range;
+        # returned as a string array that can be assigned straight to a column
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        unique_id = f"VT{timestamp}{current_id:06d}"
-        
-        return unique_id
-    
-    def get_multiple_ids(self, count):
-        """Get multiple unique IDs at once"""
-        ids = []
-        for _ in range(count):
-            ids.append(self.get_next_id())
-        return ids
+        counters = np.arange(start, start + count, dtype=np.int64).astype(str)
+        return np.char.add(f"VT{timestamp}", np.char.zfill(counters, 6))
 
-# Create global instance
+# Create global instance (one per process; counter state lives in session_state)
+@st.cache_resource
 def get_id_generator():
     return UniqueIDGenerator()
\ No newline at end of file
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+import streamlit as st
+from streamlit.proto.Common_pb2 import FileURLs
+from streamlit.runtime.uploaded_file_manager import UploadedFile, UploadedFileRec
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def isolated_session(tmp_path, monkeypatch):
+    """Give each test a fresh session state and caches, and keep ID counter files out of the repo"""
+    (tmp_path / "data").mkdir()
+    monkeypatch.chdir(tmp_path)
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+    session_state = {'id_counter': 1}
+    monkeypatch.setattr(st, 'session_state', session_state)
+
+    errors = []
+    monkeypatch.setattr(st, 'error', lambda message, *args, **kwargs: errors.append(message))
+    monkeypatch.setattr(st, 'warning', lambda *args, **kwargs: None)
+
+    return session_state, errors
+
+
+@pytest.fixture
+def make_upload():
+    """Build a Streamlit UploadedFile from CSV text, as st.file_uploader returns it"""
+    def make(text, file_id='upload-1', name='upload.csv'):
+        return UploadedFile(UploadedFileRec(file_id, name, 'text/csv', text.encode('utf-8')), FileURLs())
+    return make
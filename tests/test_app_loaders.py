@@ -0,0 +1,157 @@
+import os
+
+import pandas as pd
+
+import app
+
+
+BITWAVE_CSV = (
+    "id,dateTime,walletId,amount,memo\n"
+    "bw-1,2024-01-05T10:00:00Z,acc-alpha-ben,12.5,first\n"
+    "bw-2,2024-01-06T11:30:00Z,acc-beta,3.0,second\n"
+)
+
+
+def write_reference_csv(path, text, mtime):
+    with open(path, 'w') as f:
+        f.write(text)
+    os.utime(path, (mtime, mtime))
+
+
+# ============================================================================
+# Cached loading (chunk0-7)
+# ============================================================================
+
+def test_reference_csv_is_cached_until_modified():
+    path = 'data/vesting_wallet_pairs.csv'
+    write_reference_csv(path, "Beneficiary Wallet,Originating Wallet\nBen,Orig\n", 1_700_000_000)
+
+    first = app.read_reference_csv(path, os.path.getmtime(path))
+
+    # Same modification time: the cached parse is reused
+    write_reference_csv(path, "Beneficiary Wallet,Originating Wallet\nOther,Orig\n", 1_700_000_000)
+    assert app.read_reference_csv(path, os.path.getmtime(path))['Beneficiary Wallet'].tolist() == ['Ben']
+
+    # A newer file is parsed again
+    os.utime(path, (1_700_000_100, 1_700_000_100))
+    second = app.read_reference_csv(path, os.path.getmtime(path))
+    assert first['Beneficiary Wallet'].tolist() == ['Ben']
+    assert second['Beneficiary Wallet'].tolist() == ['Other']
+
+
+def test_uploads_are_cached_per_file_id(make_upload):
+    first = app.load_csv_file(make_upload(BITWAVE_CSV, file_id='upload-1'))
+    # Reruns hand back the same upload; its file_id and size key the cached parse
+    rerun = app.load_csv_file(make_upload(BITWAVE_CSV.replace('12.5', '99.0'), file_id='upload-1'))
+    replacement = app.load_csv_file(make_upload(BITWAVE_CSV.replace('12.5', '99.0'), file_id='upload-2'))
+
+    assert first['amount'].tolist() == [12.5, 3.0]
+    assert rerun['amount'].tolist() == [12.5, 3.0]
+    assert replacement['amount'].tolist() == [99.0, 3.0]
+
+
+def test_unreadable_upload_reports_an_error(isolated_session, make_upload):
+    _, errors = isolated_session
+
+    assert app.load_csv_file(make_upload("", file_id='empty')) is None
+    assert errors and errors[0].startswith("Error loading file:")
+
+
+# ============================================================================
+# pyarrow parsing (chunk0-8)
+# ============================================================================
+
+def test_read_csv_fast_uses_pyarrow_engine(monkeypatch, make_upload):
+    engines = []
+    read_csv = pd.read_csv
+    def recording_read_csv(*args, **kwargs):
+        engines.append(kwargs.get('engine'))
+        return read_csv(*args, **kwargs)
+    monkeypatch.setattr(pd, 'read_csv', recording_read_csv)
+
+    df = app.read_csv_fast(make_upload(BITWAVE_CSV))
+
+    assert engines == ['pyarrow']
+    assert df['id'].tolist() == ['bw-1', 'bw-2']
+
+
+def test_read_csv_fast_falls_back_when_pyarrow_fails(monkeypatch, make_upload):
+    read_csv = pd.read_csv
+    def failing_pyarrow(*args, **kwargs):
+        if kwargs.get('engine') == 'pyarrow':
+            raise ValueError("pyarrow unavailable")
+        return read_csv(*args, **kwargs)
+    monkeypatch.setattr(pd, 'read_csv', failing_pyarrow)
+
+    df = app.read_csv_fast(make_upload(BITWAVE_CSV), usecols=app.BITWAVE_COLS)
+
+    assert list(df.columns) == ['id', 'dateTime', 'walletId', 'amount']
+    assert df['amount'].tolist() == [12.5, 3.0]
+
+
+# ============================================================================
+# Bitwave dateTime parsed at load (chunk0-21)
+# ============================================================================
+
+def test_bitwave_datetime_is_parsed_once_at_load(make_upload):
+    text = BITWAVE_CSV + "bw-3,not a date,acc-beta,1.0,third\n"
+
+    df = app.load_csv_file(make_upload(text), date_column='dateTime')
+
+    # Timezones are dropped so the values compare against naive Stage 1 dates
+    assert pd.api.types.is_datetime64_dtype(df['dateTime'])
+    assert df['dateTime'].dt.tz is None
+    assert df['dateTime'].tolist()[:2] == [pd.Timestamp('2024-01-05 10:00:00'), pd.Timestamp('2024-01-06 11:30:00')]
+    assert pd.isna(df['dateTime'].iloc[2])
+
+
+# ============================================================================
+# Column projection (chunk1-2)
+# ============================================================================
+
+def test_uploads_read_only_the_requested_columns(make_upload):
+    df = app.load_csv_file(make_upload(BITWAVE_CSV), usecols=app.BITWAVE_COLS)
+
+    assert list(df.columns) == ['id', 'dateTime', 'walletId', 'amount']
+    assert app.validate(df, 'bitwave') == (True, [])
+
+
+def test_missing_projected_columns_are_left_for_validation(make_upload):
+    df = app.load_csv_file(make_upload("id,walletId,amount\nbw-1,acc-beta,1.0\n"), usecols=app.BITWAVE_COLS)
+
+    assert list(df.columns) == ['id', 'walletId', 'amount']
+    assert app.validate(df, 'bitwave') == (False, ['dateTime'])
+    assert app.missing_columns_message('bitwave', ['dateTime']) == "Missing required columns in Bitwave Export: dateTime"
+
+
+def test_read_csv_fast_keeps_short_hex_addresses_as_text(make_upload):
+    text = (
+        "End Time,Type,Source Addresses,Destination Address,Value (USD)\n"
+        "2024-01-05 08:00:00,Balance Adjustment,0x1,0xa1,1.0\n"
+        "2024-01-06 08:00:00,Balance Adjustment,0x1,,2.0\n"
+    )
+
+    df = app.read_csv_fast(make_upload(text))
+
+    assert df['Source Addresses'].tolist() == ['0x1', '0x1']
+    assert df['Destination Address'].tolist()[0] == '0xa1'
+    assert df['Value (USD)'].tolist() == [1.0, 2.0]
+
+
+# ============================================================================
+# Reference data loading (chunk1-19)
+# ============================================================================
+
+def test_load_initial_data_reads_the_reference_files_as_is(isolated_session):
+    session_state, _ = isolated_session
+    with open('data/wallets_list.csv', 'w') as f:
+        f.write("ID,Name,Addresses,Notes\nacc-alpha,Aptos Alpha,0xa1,\n")
+    with open('data/vesting_wallet_pairs.csv', 'w') as f:
+        f.write("Beneficiary Wallet,Originating Wallet\nAlpha Beneficiary,Aptos Alpha\n")
+
+    app.load_initial_data()
+
+    assert list(session_state['wallets_list'].columns) == ['ID', 'Name', 'Addresses', 'Notes']
+    assert session_state['wallets_list']['Addresses'].tolist() == ['0xa1']
+    assert session_state['vesting_pairs']['Originating Wallet'].tolist() == ['Aptos Alpha']
+    assert 'wallet_address_uniques' not in session_state
@@ -0,0 +1,196 @@
+import pandas as pd
+import pytest
+
+from utils import file_processors
+from utils.file_processors import FileProcessor
+
+
+ANCHORAGE_CSV = (
+    "End Time,Type,Asset Type,Asset Quantity (Before Fee),Value (USD),Fee Quantity,"
+    "Fee Value (USD),Fee Asset Type,Source Addresses,Destination Address,Memo\n"
+    "2024-01-05 08:00:00,Balance Adjustment,APT,4.0,40.0,0,0,APT,0xsrc,0xa1,first\n"
+    "2024-01-06 09:00:00,Withdrawal,APT,6.0,60.0,0,0,APT,0xsrc,0xb1,second\n"
+)
+
+
+# ============================================================================
+# Reading (chunk1-1)
+# ============================================================================
+
+@pytest.mark.skipif(file_processors.pl is not None, reason="exercises the pandas fallback")
+def test_load_csv_file_falls_back_to_pandas_without_polars(make_upload):
+    df = FileProcessor.load_csv_file(make_upload(ANCHORAGE_CSV), as_polars=True)
+
+    assert isinstance(df, pd.DataFrame)
+    assert df['Asset Quantity (Before Fee)'].tolist() == [4.0, 6.0]
+
+
+@pytest.mark.skipif(file_processors.pl is None, reason="Polars is not installed")
+def test_load_csv_file_reads_with_polars(make_upload):
+    df = FileProcessor.load_csv_file(make_upload(ANCHORAGE_CSV), as_polars=True)
+
+    assert isinstance(df, file_processors.pl.DataFrame)
+    assert df['Asset Quantity (Before Fee)'].to_list() == [4.0, 6.0]
+
+
+def test_load_csv_file_returns_pandas_by_default(make_upload):
+    df = FileProcessor.load_csv_file(make_upload(ANCHORAGE_CSV))
+
+    assert isinstance(df, pd.DataFrame)
+    assert df['Destination Address'].tolist() == ['0xa1', '0xb1']
+    # Wallet identifiers are stored as categoricals
+    assert isinstance(df['Destination Address'].dtype, pd.CategoricalDtype)
+
+
+def test_load_csv_file_without_upload_returns_none():
+    assert FileProcessor.load_csv_file(None) is None
+
+
+# ============================================================================
+# pyarrow engine (chunk1-15)
+# ============================================================================
+
+def test_read_csv_parses_with_the_pyarrow_engine(monkeypatch, make_upload):
+    engines = []
+    read_csv = pd.read_csv
+    def recording_read_csv(*args, **kwargs):
+        engines.append(kwargs.get('engine'))
+        return read_csv(*args, **kwargs)
+    monkeypatch.setattr(file_processors, 'pl', None)
+    monkeypatch.setattr(pd, 'read_csv', recording_read_csv)
+
+    df = FileProcessor._read_csv(make_upload(ANCHORAGE_CSV.replace('0xa1', '0x' + 'a' * 64).replace('0xb1', '0x' + 'b' * 64)))
+
+    assert engines == ['pyarrow']
+    assert df['Value (USD)'].tolist() == [40.0, 60.0]
+
+
+def test_read_csv_keeps_short_hex_addresses_as_text(monkeypatch, make_upload):
+    monkeypatch.setattr(file_processors, 'pl', None)
+
+    df = FileProcessor._read_csv(make_upload(ANCHORAGE_CSV.replace('0xsrc', '0x1')))
+
+    assert df['Source Addresses'].tolist() == ['0x1', '0x1']
+    assert df['Destination Address'].tolist() == ['0xa1', '0xb1']
+
+
+def test_read_csv_falls_back_to_the_c_engine(monkeypatch, make_upload):
+    read_csv = pd.read_csv
+    def failing_pyarrow(*args, **kwargs):
+        if kwargs.get('engine') == 'pyarrow':
+            raise ValueError("pyarrow unavailable")
+        return read_csv(*args, **kwargs)
+    monkeypatch.setattr(file_processors, 'pl', None)
+    monkeypatch.setattr(pd, 'read_csv', failing_pyarrow)
+
+    df = FileProcessor._read_csv(make_upload(ANCHORAGE_CSV), usecols=file_processors.BITWAVE_COLS + ['Type'])
+
+    assert list(df.columns) == ['Type']
+    assert df['Type'].tolist() == ['Balance Adjustment', 'Withdrawal']
+
+
+# ============================================================================
+# Date parsing (chunk1-4)
+# ============================================================================
+
+def test_parse_date_series_parses_a_column_at_once():
+    parsed = FileProcessor.parse_date_series(pd.Series(['2024-01-05 08:00:00', '01/06/2024', 'not a date']))
+
+    assert parsed.tolist()[:2] == [pd.Timestamp('2024-01-05 08:00:00'), pd.Timestamp('2024-01-06')]
+    assert pd.isna(parsed.iloc[2])
+
+
+def test_parse_date_matches_the_series_parser():
+    assert FileProcessor.parse_date('2024-01-05 08:00:00') == pd.Timestamp('2024-01-05 08:00:00')
+    assert FileProcessor.parse_date('not a date') is None
+
+
+# ============================================================================
+# Cached loading (chunk1-5)
+# ============================================================================
+
+def test_load_csv_file_is_cached_on_the_uploaded_bytes(monkeypatch, make_upload):
+    reads = []
+    read_csv = FileProcessor._read_csv
+    def counting_read_csv(*args, **kwargs):
+        reads.append(1)
+        return read_csv(*args, **kwargs)
+    monkeypatch.setattr(FileProcessor, '_read_csv', staticmethod(counting_read_csv))
+
+    first = FileProcessor.load_csv_file(make_upload(ANCHORAGE_CSV, file_id='upload-1'))
+    again = FileProcessor.load_csv_file(make_upload(ANCHORAGE_CSV, file_id='upload-2'))
+    changed = FileProcessor.load_csv_file(make_upload(ANCHORAGE_CSV.replace('40.0', '41.0'), file_id='upload-1'))
+
+    assert len(reads) == 2
+    assert first['Value (USD)'].tolist() == again['Value (USD)'].tolist() == [40.0, 60.0]
+    assert changed['Value (USD)'].tolist() == [41.0, 60.0]
+
+
+# ============================================================================
+# Column validation (chunk1-10)
+# ============================================================================
+
+def test_validate_reports_missing_columns_in_required_order():
+    df = pd.DataFrame(columns=['amount', 'walletId', 'extra'])
+
+    assert FileProcessor.validate(df, 'bitwave') == (False, ['id', 'dateTime'])
+
+
+# ============================================================================
+# Date range filtering (chunk1-11)
+# ============================================================================
+
+def test_filter_date_range_is_inclusive_and_leaves_the_input_alone():
+    df = pd.DataFrame({'dateTime': ['2024-01-04', '2024-01-05', '2024-01-10', '2024-01-11'], 'amount': [1, 2, 3, 4]})
+    original = df.copy()
+
+    filtered = FileProcessor.filter_date_range(df, 'dateTime', '2024-01-05', '2024-01-10')
+
+    assert filtered['amount'].tolist() == [2, 3]
+    pd.testing.assert_frame_equal(df, original)
+
+
+def test_filter_date_range_is_idempotent_on_parsed_dates():
+    df = pd.DataFrame({'dateTime': pd.to_datetime(['2024-01-04', '2024-01-05', '2024-01-11']), 'amount': [1, 2, 3]})
+
+    once = FileProcessor.filter_date_range(df, 'dateTime', '2024-01-05', '2024-01-10')
+    twice = FileProcessor.filter_date_range(once, 'dateTime', '2024-01-05', '2024-01-10')
+
+    assert once['amount'].tolist() == twice['amount'].tolist() == [2]
+
+
+# ============================================================================
+# Schema registry (chunk1-21)
+# ============================================================================
+
+@pytest.mark.parametrize('kind', sorted(file_processors.SCHEMA_REGISTRY))
+def test_validate_accepts_every_registered_schema(kind):
+    df = pd.DataFrame(columns=list(file_processors.SCHEMA_REGISTRY[kind]) + ['extra'])
+
+    assert FileProcessor.validate(df, kind) == (True, [])
+
+
+def test_validate_unknown_kind_is_rejected():
+    with pytest.raises(KeyError):
+        FileProcessor.validate(pd.DataFrame(), 'unknown')
+
+
+# ============================================================================
+# Pure validation and error messages (chunk1-23)
+# ============================================================================
+
+def test_validate_makes_no_streamlit_calls(isolated_session):
+    _, errors = isolated_session
+
+    assert FileProcessor.validate(pd.DataFrame(columns=['ID']), 'wallets') == (False, ['Name', 'Addresses'])
+    assert errors == []
+
+
+@pytest.mark.parametrize('kind, message', [
+    ('anchorage', "Missing required columns: Type, Fee Quantity"),
+    ('wallets', "Missing required columns in Wallets List: Type, Fee Quantity"),
+    ('pairs', "Missing required columns in Vesting Wallet Pairs: Type, Fee Quantity"),
+    ('bitwave', "Missing required columns in Bitwave Export: Type, Fee Quantity"),
+])
+def test_missing_columns_message(kind, message):
+    assert FileProcessor.missing_columns_message(kind, ['Type', 'Fee Quantity']) == message
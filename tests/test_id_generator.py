@@ -0,0 +1,136 @@
+import json
+
+import app
+import id_generator
+from id_generator import UniqueIDGenerator, get_id_generator
+
+
+def counter_value(unique_id):
+    return int(unique_id[-6:])
+
+
+# ============================================================================
+# Batched reservation (chunk1-6)
+# ============================================================================
+
+def test_get_multiple_ids_reserves_a_range_and_saves_once(isolated_session, monkeypatch):
+    session_state, _ = isolated_session
+    generator = UniqueIDGenerator()
+    saves = []
+    save_counter = generator.save_counter
+    monkeypatch.setattr(generator, 'save_counter', lambda: (saves.append(1), save_counter()))
+
+    ids = generator.get_multiple_ids(3)
+
+    assert [counter_value(unique_id) for unique_id in ids] == [1, 2, 3]
+    assert len({unique_id[:-6] for unique_id in ids}) == 1
+    assert session_state['id_counter'] == 4
+    assert len(saves) == 1
+
+
+def test_get_next_id_continues_the_sequence(isolated_session):
+    generator = UniqueIDGenerator()
+    generator.get_multiple_ids(2)
+
+    next_id = generator.get_next_id()
+
+    assert isinstance(next_id, str)
+    assert next_id.startswith('VT')
+    assert counter_value(next_id) == 3
+
+
+# ============================================================================
+# NumPy ID formatting (chunk1-7)
+# ============================================================================
+
+def test_get_multiple_ids_pads_the_counter_to_six_digits(isolated_session):
+    session_state, _ = isolated_session
+    session_state['id_counter'] = 41
+
+    ids = UniqueIDGenerator().get_multiple_ids(2)
+
+    assert [unique_id[-6:] for unique_id in ids] == ['000041', '000042']
+    assert all(len(unique_id) == len('VT') + 14 + 6 for unique_id in ids)
+
+
+def test_get_multiple_ids_with_zero_count_reserves_nothing(isolated_session):
+    session_state, _ = isolated_session
+
+    ids = UniqueIDGenerator().get_multiple_ids(0)
+
+    assert len(ids) == 0
+    assert session_state['id_counter'] == 1
+
+
+# ============================================================================
+# Cached generator and plain-integer counter file (chunk1-14)
+# ============================================================================
+
+def test_get_id_generator_returns_one_shared_instance():
+    assert get_id_generator() is get_id_generator()
+
+
+def test_counter_is_saved_as_a_plain_integer(isolated_session):
+    UniqueIDGenerator().get_multiple_ids(5)
+
+    with open('data/id_counter.txt') as f:
+        assert f.read() == '6'
+
+
+def test_legacy_json_counter_is_read_until_the_first_save(isolated_session):
+    session_state, _ = isolated_session
+    del session_state['id_counter']
+    with open('data/id_counter.json', 'w') as f:
+        json.dump({'counter': 42}, f)
+
+    ids = UniqueIDGenerator().get_multiple_ids(1)
+
+    assert counter_value(ids[0]) == 42
+    with open('data/id_counter.txt') as f:
+        assert f.read() == '43'
+
+
+def test_both_generators_share_one_counter_file(isolated_session):
+    session_state, _ = isolated_session
+    app_generator = app.UniqueIDGenerator()
+    app_generator.get_ids(3)
+    app_generator.flush()
+
+    # A new session picks up where the other generator left off, and vice versa
+    del session_state['id_counter']
+    assert counter_value(UniqueIDGenerator().get_multiple_ids(2)[0]) == 4
+
+    del session_state['id_counter']
+    assert counter_value(app.UniqueIDGenerator().get_next_id()) == 6
+
+
+# ============================================================================
+# Counter file access (chunk1-17)
+# ============================================================================
+
+def test_missing_or_unreadable_counter_starts_at_one(isolated_session):
+    session_state, _ = isolated_session
+    del session_state['id_counter']
+    UniqueIDGenerator()
+    assert session_state['id_counter'] == 1
+
+    with open('data/id_counter.txt', 'w') as f:
+        f.write('not a number')
+    del session_state['id_counter']
+    UniqueIDGenerator()
+    assert session_state['id_counter'] == 1
+
+
+def test_counter_directory_is_created_once(isolated_session, monkeypatch, tmp_path):
+    (tmp_path / 'data').rmdir()
+    created = []
+    makedirs = id_generator.os.makedirs
+    monkeypatch.setattr(id_generator.os, 'makedirs', lambda *args, **kwargs: (created.append(1), makedirs(*args, **kwargs)))
+    generator = UniqueIDGenerator()
+
+    generator.get_multiple_ids(1)
+    generator.get_multiple_ids(1)
+
+    assert len(created) == 1
+    with open('data/id_counter.txt') as f:
+        assert f.read() == '3'
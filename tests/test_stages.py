@@ -0,0 +1,383 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+from streamlit.runtime.caching import hashing
+
+import app
+from utils.file_processors import dataframe_to_csv_bytes as utils_dataframe_to_csv_bytes
+from utils.stage_processors import StageProcessor
+
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+@pytest.fixture
+def wallets_df():
+    return pd.DataFrame({
+        'ID': ['acc-alpha', 'acc-alpha-vt', 'acc-beta', 'acc-alpha-ben',
+               'g-full', 'g-stripped', 'acc-alpha-dup'],
+        'Name': ['Aptos Alpha', 'Alpha vesting tokens', 'Beta', 'Alpha Beneficiary',
+                 'Aptos Gamma vesting tokens', 'Gamma vesting tokens', 'Alpha Beneficiary'],
+        'Addresses': ['0xa1', None, '0xb1', None, None, None, None],
+        'Notes': [''] * 7
+    })
+
+
+@pytest.fixture
+def vesting_pairs_df():
+    return pd.DataFrame({
+        'Originating Wallet': ['Aptos Alpha', 'Aptos Gamma'],
+        'Beneficiary Wallet': ['Alpha Beneficiary', 'Missing Beneficiary']
+    })
+
+
+@pytest.fixture
+def stage1_df():
+    return pd.DataFrame({
+        'Date': [date(2024, 1, 5), date(2024, 1, 5), date(2024, 1, 6)],
+        'Wallet Name': ['Aptos Alpha', 'Delta', 'Aptos Gamma'],
+        'Asset Quantity (Before Fee)': [10.0, 1.0, 3.0],
+        'Value (USD)': [100.0, 2.0, 30.0]
+    })
+
+
+def counters(ids):
+    """Counter part of generated IDs, relative to the first one"""
+    numbers = [int(unique_id[-6:]) for unique_id in ids]
+    return [number - numbers[0] for number in numbers]
+
+
+def bitwave(rows, parse=True):
+    """Bitwave export rows of (id, walletId, dateTime, amount) in export order"""
+    df = pd.DataFrame(rows, columns=['id', 'walletId', 'dateTime', 'amount'])
+    if parse:
+        df['dateTime'] = app.parse_timestamps(df['dateTime'])
+    return df
+
+
+# ============================================================================
+# app.py
+# ============================================================================
+
+def test_app_stage1_sums_balance_adjustments_per_day_and_address(wallets_df):
+    anchorage_df = pd.DataFrame({
+        'End Time': ['2024-01-05 08:00:00', '2024-01-05 17:00:00', '2024-01-05 09:00:00', '2024-01-06 10:00:00'],
+        'Type': ['Balance Adjustment', 'Balance Adjustment', 'Withdrawal', 'Balance Adjustment'],
+        'Source Addresses': ['0xa1', '0xa1', '0xa1', '0xunknown'],
+        'Asset Quantity (Before Fee)': [-4.0, -6.0, -100.0, 2.0],
+        'Value (USD)': [-40.0, -60.0, -1000.0, 20.0]
+    })
+
+    result = app.process_stage_1(anchorage_df, wallets_df).reset_index(drop=True)
+
+    assert result['Date'].tolist() == [date(2024, 1, 5), date(2024, 1, 6)]
+    assert result['Wallet Name'].tolist() == ['Aptos Alpha', '0xunknown']
+    assert result['Asset Quantity (Before Fee)'].tolist() == [10.0, 2.0]
+    assert result['Value (USD)'].tolist() == [100.0, 20.0]
+
+
+def test_app_stage1_later_wallet_rows_win_for_repeated_addresses():
+    wallets_df = app.categorize_wallet_columns(pd.DataFrame({
+        'ID': ['old', 'new'],
+        'Name': ['Old Name', 'New Name'],
+        'Addresses': ['0xa1', '0xa1'],
+        'Notes': ['', '']
+    }))
+    anchorage_df = pd.DataFrame({
+        'End Time': ['2024-01-05 08:00:00'],
+        'Type': ['Balance Adjustment'],
+        'Source Addresses': ['0xa1'],
+        'Asset Quantity (Before Fee)': [-4.0],
+        'Value (USD)': [-40.0]
+    })
+
+    result = app.process_stage_1(anchorage_df, wallets_df)
+
+    assert result['Wallet Name'].tolist() == ['New Name']
+
+
+def test_app_stage2_rows_accounts_and_error_log(isolated_session, stage1_df, wallets_df, vesting_pairs_df):
+    session_state, _ = isolated_session
+
+    result = app.process_stage_2(stage1_df, wallets_df, vesting_pairs_df)
+
+    # Withdrawal/deposit pairs stay interleaved in Stage 1 order
+    assert result['transactionType'].tolist() == ['withdrawal', 'deposit', 'withdrawal']
+    # "Aptos Alpha vesting tokens" is missing, so the "Aptos " prefix is dropped;
+    # "Aptos Gamma vesting tokens" exists and wins over the stripped name
+    assert result['accountId'].tolist() == ['acc-alpha-vt', 'acc-alpha-ben', 'g-full']
+    assert result['blockchainId'].tolist() == [
+        'acc-alpha-vt.vestingdistribute.010524',
+        'acc-alpha-ben.vestingdistribute.010524',
+        'g-full.vestingdistribute.010624'
+    ]
+    assert result['time'].tolist() == ['01/05/2024 12:00:00', '01/05/2024 12:00:00', '01/06/2024 12:00:00']
+    # Two IDs are reserved per Stage 1 row, including rows that were skipped
+    assert counters(result['id'].tolist()) == [0, 1, 4]
+    assert list(result.columns) == app.TRANSACTION_COLUMNS
+
+    error_log = session_state['stage2_errors']
+    assert error_log['Wallet Name'].tolist() == ['Delta', 'Delta', 'Aptos Gamma']
+    assert error_log['Error Type'].tolist() == [
+        'Missing Vesting Tokens Wallet', 'No Originating Wallet Match', 'No Beneficiary Wallet Match'
+    ]
+
+
+def test_app_stage2_error_log_adds_beneficiary_column_only_when_needed(isolated_session, wallets_df, vesting_pairs_df):
+    session_state, _ = isolated_session
+    stage1_df = pd.DataFrame({
+        'Date': [date(2024, 1, 5)],
+        'Wallet Name': ['Delta'],
+        'Asset Quantity (Before Fee)': [1.0],
+        'Value (USD)': [2.0]
+    })
+
+    app.process_stage_2(stage1_df, wallets_df, vesting_pairs_df)
+
+    assert list(session_state['stage2_errors'].columns) == ['Wallet Name', 'Error Type', 'Error Message']
+
+    stage1_df['Wallet Name'] = 'Aptos Gamma'
+    app.process_stage_2(stage1_df, wallets_df, vesting_pairs_df)
+
+    error_log = session_state['stage2_errors']
+    assert list(error_log.columns) == ['Wallet Name', 'Error Type', 'Error Message', 'Beneficiary Wallet']
+    assert error_log['Beneficiary Wallet'].tolist() == ['Missing Beneficiary']
+
+
+@pytest.mark.parametrize('date_time, matched', [
+    ('2023-12-15 23:59:59', False),
+    ('2023-12-16 00:00:00', True),
+    ('2024-01-25 00:00:00', True),
+    ('2024-01-25 00:00:01', False),
+])
+def test_app_stage3_window_is_20_days_either_side_inclusive(
+        isolated_session, stage1_df, wallets_df, vesting_pairs_df, date_time, matched):
+    stage2_df = app.process_stage_2(stage1_df, wallets_df, vesting_pairs_df)
+    bitwave_df = bitwave([('bw-1', 'acc-alpha-ben', date_time, 25.0)])
+
+    output_df, _ = app.process_stage_3(stage1_df, stage2_df, bitwave_df, wallets_df, vesting_pairs_df)
+
+    assert len(output_df) == int(matched)
+
+
+def test_app_stage3_and_stage4_use_first_match_in_export_order(
+        isolated_session, stage1_df, wallets_df, vesting_pairs_df):
+    stage2_df = app.process_stage_2(stage1_df, wallets_df, vesting_pairs_df)
+    bitwave_df = bitwave([
+        ('bw-late', 'acc-alpha-ben', '2024-01-25 00:00:01', 50.0),
+        ('bw-small', 'acc-alpha-ben', '2023-12-20 00:00:00', 9.0),
+        ('bw-first', 'acc-alpha-ben', '2024-01-20 00:00:00', 12.0),
+        ('bw-earlier', 'acc-alpha-ben', '2024-01-04 00:00:00', 11.0),
+        ('bw-other', 'acc-beta', '2024-01-05 00:00:00', 99.0),
+    ])
+
+    output_df, display_df = app.process_stage_3(stage1_df, stage2_df, bitwave_df, wallets_df, vesting_pairs_df)
+
+    assert output_df['amount'].tolist() == [2.0]
+    assert output_df['accountId'].tolist() == ['acc-alpha-ben']
+    assert output_df['blockchainId'].tolist() == ['acc-alpha-ben.vestingstakingrewards.010524']
+    assert output_df['time'].tolist() == ['01/05/2024 12:00:00']
+    assert list(output_df.columns) == app.TRANSACTION_COLUMNS
+    # First ID match wins for the display name
+    assert display_df['Wallet Name'].tolist() == ['Alpha Beneficiary']
+
+    stage4_df = app.process_stage_4()
+    assert stage4_df['transactionID'].tolist() == ['bw-first']
+    assert stage4_df['action'].tolist() == ['ignore']
+
+
+@pytest.mark.parametrize('rows', [
+    [],
+    [('bw-1', 'acc-alpha-ben', '2024-01-06 00:00:00', 5.0)],
+])
+def test_app_stage3_without_matches_returns_empty_frames(
+        isolated_session, stage1_df, wallets_df, vesting_pairs_df, rows):
+    session_state, errors = isolated_session
+    stage2_df = app.process_stage_2(stage1_df, wallets_df, vesting_pairs_df)
+
+    output_df, display_df = app.process_stage_3(stage1_df, stage2_df, bitwave(rows), wallets_df, vesting_pairs_df)
+
+    assert errors == []
+    assert output_df.empty and display_df.empty
+    assert list(output_df.columns) == app.TRANSACTION_COLUMNS
+    assert session_state['stage3_matched_transactions'].empty
+    assert app.process_stage_4().empty
+
+
+@pytest.mark.parametrize('debug', [False, True])
+def test_app_stage3_debug_output_only_when_debugging(
+        isolated_session, monkeypatch, stage1_df, wallets_df, vesting_pairs_df, debug):
+    session_state, _ = isolated_session
+    session_state['debug'] = debug
+    written = []
+    monkeypatch.setattr(app.st, 'write', lambda message, *args, **kwargs: written.append(message))
+    stage2_df = app.process_stage_2(stage1_df, wallets_df, vesting_pairs_df)
+    bitwave_df = bitwave([('bw-1', 'acc-alpha-ben', '2024-01-06 00:00:00', 25.0)])
+
+    app.process_stage_3(stage1_df, stage2_df, bitwave_df, wallets_df, vesting_pairs_df)
+
+    assert any(message.startswith('DEBUG BITWAVE') for message in written) == debug
+
+
+def test_app_download_bytes_match_pandas(isolated_session, stage1_df, wallets_df, vesting_pairs_df):
+    stage2_df = app.process_stage_2(stage1_df, wallets_df, vesting_pairs_df)
+
+    assert app.dataframe_to_csv_bytes(stage2_df) == stage2_df.to_csv(index=False).encode('utf-8')
+
+
+def unsampled_rows(df):
+    """Index of the rows st.cache_data leaves out when it hashes a frame of 50,000+ rows"""
+    sampled = df.sample(n=hashing._PANDAS_SAMPLE_SIZE, random_state=hashing._sample_seed()).index
+    return df.index.difference(sampled)
+
+
+def test_download_bytes_follow_changes_outside_the_hash_sample():
+    df = pd.DataFrame({'id': range(60_000), 'amount': 1.0})
+    before = app.dataframe_to_csv_bytes(df), utils_dataframe_to_csv_bytes(df)
+    df.loc[unsampled_rows(df), 'amount'] = 2.0
+
+    assert app.dataframe_to_csv_bytes(df) == df.to_csv(index=False).encode('utf-8') != before[0]
+    assert utils_dataframe_to_csv_bytes(df) == df.to_csv(index=False).encode('utf-8') != before[1]
+
+
+# ============================================================================
+# utils/stage_processors.py
+# ============================================================================
+
+def test_utils_stage1_sums_balance_adjustments_per_day_and_address(wallets_df):
+    anchorage_df = pd.DataFrame({
+        'End Time': ['2024-01-05 08:00:00', '2024-01-05 17:00:00', '2024-01-05 09:00:00', '2024-01-06 10:00:00'],
+        'Type': ['Balance Adjustment', 'Balance Adjustment', 'Withdrawal', 'Balance Adjustment'],
+        'Destination Address': ['0xa1', '0xa1', '0xa1', '0xunknown'],
+        'Asset Quantity (Before Fee)': [4.0, 6.0, 100.0, 2.0],
+        'Value (USD)': [40.0, 60.0, 1000.0, 20.0]
+    })
+
+    result = StageProcessor.process_stage_1(anchorage_df, wallets_df).reset_index(drop=True)
+
+    assert result['Date'].tolist() == [date(2024, 1, 5), date(2024, 1, 6)]
+    assert result['Wallet Name'].tolist() == ['Aptos Alpha', '0xunknown']
+    assert result['Asset Quantity (Before Fee)'].tolist() == [10.0, 2.0]
+    assert result['Value (USD)'].tolist() == [100.0, 20.0]
+
+
+def test_utils_stage2_rows_accounts_and_errors(isolated_session, stage1_df, wallets_df, vesting_pairs_df):
+    _, errors = isolated_session
+
+    result = StageProcessor.process_stage_2(stage1_df, wallets_df, vesting_pairs_df)
+
+    assert result['transactionType'].tolist() == ['withdrawal', 'deposit', 'withdrawal']
+    # The "Aptos " prefix is always dropped before appending " vesting tokens"
+    assert result['accountId'].tolist() == ['acc-alpha-vt', 'acc-alpha-ben', 'g-stripped']
+    assert result['blockchainId'].tolist() == [
+        'acc-alpha-vt.vestingdistribute.010524',
+        'acc-alpha-ben.vestingdistribute.010524',
+        'g-stripped.vestingdistribute.010624'
+    ]
+    assert counters(result['id'].tolist()) == [0, 1, 4]
+    assert list(result.columns) == list(StageProcessor._STAGE2_ROW_TEMPLATE)
+
+    assert errors == [
+        "Missing a vesting tokens wallet: Delta",
+        "No Originating Wallet Match in the Vesting Wallet Pairs table for: Delta",
+        "No Beneficiary Wallet Match in the Wallets list for: Missing Beneficiary"
+    ]
+
+
+@pytest.mark.parametrize('date_time, matched', [
+    ('2024-01-05 00:00:00', False),
+    ('2024-01-05 00:00:01', True),
+    ('2024-01-15 00:00:00', True),
+    ('2024-01-15 00:00:01', False),
+])
+def test_utils_stage3_window_is_the_following_10_days(
+        isolated_session, stage1_df, wallets_df, vesting_pairs_df, date_time, matched):
+    stage2_df = StageProcessor.process_stage_2(stage1_df, wallets_df, vesting_pairs_df)
+    bitwave_df = bitwave([('bw-1', 'acc-alpha-ben', date_time, 25.0)], parse=False)
+
+    output_df, _ = StageProcessor.process_stage_3(stage1_df, stage2_df, bitwave_df, wallets_df, vesting_pairs_df)
+
+    assert len(output_df) == int(matched)
+
+
+def test_utils_stage3_and_stage4_use_first_match_in_export_order(
+        isolated_session, stage1_df, wallets_df, vesting_pairs_df):
+    stage2_df = StageProcessor.process_stage_2(stage1_df, wallets_df, vesting_pairs_df)
+    bitwave_df = bitwave([
+        ('bw-start', 'acc-alpha-ben', '2024-01-05T00:00:00Z', 50.0),
+        ('bw-small', 'acc-alpha-ben', '2024-01-07T00:00:00Z', 9.0),
+        ('bw-first', 'acc-alpha-ben', '2024-01-15T00:00:00Z', 12.0),
+        ('bw-earlier', 'acc-alpha-ben', '2024-01-06T00:00:00Z', 11.0),
+        ('bw-other', 'acc-beta', '2024-01-06T00:00:00Z', 99.0),
+    ], parse=False)
+
+    output_df, display_df = StageProcessor.process_stage_3(
+        stage1_df, stage2_df, bitwave_df, wallets_df, vesting_pairs_df
+    )
+
+    assert output_df['amount'].tolist() == [2.0]
+    assert output_df['accountId'].tolist() == ['acc-alpha-ben']
+    assert output_df['blockchainId'].tolist() == ['acc-alpha-ben.vestingstakingrewards.010524']
+    assert output_df['time'].tolist() == ['01/05/2024 12:00:00']
+    assert list(output_df.columns) == list(StageProcessor._STAGE3_ROW_TEMPLATE)
+    assert display_df['Wallet Name'].tolist() == ['Alpha Beneficiary']
+
+    stage4_df = StageProcessor.process_stage_4()
+    assert stage4_df['transactionID'].tolist() == ['bw-first']
+    assert stage4_df['action'].tolist() == ['ignore']
+
+
+@pytest.mark.parametrize('rows', [
+    [],
+    [('bw-1', 'acc-alpha-ben', '2024-01-06T00:00:00Z', 5.0)],
+])
+def test_utils_stage3_without_matches_returns_empty_frames(
+        isolated_session, stage1_df, wallets_df, vesting_pairs_df, rows):
+    session_state, errors = isolated_session
+    stage2_df = StageProcessor.process_stage_2(stage1_df, wallets_df, vesting_pairs_df)
+    bitwave_df = bitwave(rows, parse=False)
+
+    output_df, display_df = StageProcessor.process_stage_3(
+        stage1_df, stage2_df, bitwave_df, wallets_df, vesting_pairs_df
+    )
+
+    assert not any(message.startswith("Error in Stage 3 processing") for message in errors)
+    assert output_df.empty and display_df.empty
+    assert list(output_df.columns) == list(StageProcessor._STAGE3_ROW_TEMPLATE)
+    assert session_state['stage3_matched_transactions'].empty
+    assert StageProcessor.process_stage_4().empty
+
+
+def test_utils_bitwave_prep_follows_changes_outside_the_hash_sample():
+    bitwave_df = pd.DataFrame({
+        'id': [f'bw-{n}' for n in range(60_000)],
+        'walletId': 'acc-alpha-ben',
+        'dateTime': '2024-01-06T00:00:00Z',
+        'amount': 1.0
+    })
+    StageProcessor._build_bitwave_index(bitwave_df)
+    bitwave_df.loc[unsampled_rows(bitwave_df), 'amount'] = 2.0
+
+    _, amounts, _, _ = StageProcessor._build_bitwave_index(bitwave_df)['acc-alpha-ben']
+
+    assert amounts.sum() == bitwave_df['amount'].sum()
+
+
+def test_utils_bitwave_prep_follows_reordered_rows():
+    bitwave_df = bitwave([
+        ('bw-1', 'acc-alpha-ben', '2024-01-06T00:00:00Z', 11.0),
+        ('bw-2', 'acc-alpha-ben', '2024-01-06T00:00:00Z', 12.0),
+    ], parse=False)
+    StageProcessor._build_bitwave_index(bitwave_df)
+
+    _, _, ids, positions = StageProcessor._build_bitwave_index(bitwave_df.iloc[::-1])['acc-alpha-ben']
+
+    assert ids[positions.argmin()] == 'bw-2'
+
+
+def test_utils_download_bytes_match_pandas(isolated_session, stage1_df, wallets_df, vesting_pairs_df):
+    stage2_df = StageProcessor.process_stage_2(stage1_df, wallets_df, vesting_pairs_df)
+
+    assert utils_dataframe_to_csv_bytes(stage2_df) == stage2_df.to_csv(index=False).encode('utf-8')
@@ -1,85 +1,148 @@
 import pandas as pd
 import streamlit as st
-from datetime import datetime, timedelta
 import io
 
+try:
+    import polars as pl
+except ImportError:  # Polars is optional; fall back to pandas parsing
+    pl = None
+
+# Columns required (and read) for each input file
+ANCHORAGE_COLS = [
+    'End Time', 'Type', 'Asset Type', 'Asset Quantity (Before Fee)',
+    'Value (USD)', 'Fee Quantity', 'Fee Value (USD)', 'Fee Asset Type',
+    'Source Addresses', 'Destination Address'
+]
+WALLETS_COLS = ['ID', 'Name', 'Addresses']
+VESTING_PAIRS_COLS = ['Beneficiary Wallet', 'Originating Wallet']
+BITWAVE_COLS = ['id', 'dateTime', 'walletId', 'amount']
+
+# Required columns and display name for each file kind accepted by FileProcessor.validate
+SCHEMA_REGISTRY = {
+    'anchorage': ANCHORAGE_COLS,
+    'wallets': WALLETS_COLS,
+    'pairs': VESTING_PAIRS_COLS,
+    'bitwave': BITWAVE_COLS,
+}
+SCHEMA_LABELS = {
+    'anchorage': None,
+    'wallets': 'Wallets List',
+    'pairs': 'Vesting Wallet Pairs',
+    'bitwave': 'Bitwave Export',
+}
+
+# Low-cardinality wallet identifiers, stored as categoricals so joins and groupbys work on integer codes
+CATEGORY_COLS = ['Addresses', 'Source Addresses', 'Destination Address', 'Beneficiary Wallet', 'Originating Wallet']
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _load_csv_cached(file_bytes, name, usecols=None, dtype=None, as_polars=False):
+    """Parse uploaded CSV bytes; cached on the bytes' hash so reruns reuse the result"""
+    return FileProcessor._read_csv(io.BytesIO(file_bytes), usecols, dtype, as_polars)
+
+def dataframe_to_csv_bytes(df):
+    """Serialize a DataFrame to CSV bytes exactly as df.to_csv(index=False) writes them"""
+    # Write straight into a byte buffer rather than building a str and encoding a second copy
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, encoding='utf-8')
+    return buffer.getvalue()
+
 class FileProcessor:
     """Handles all file processing operations"""
     
     @staticmethod
-    def load_csv_file(uploaded_file):
-        """Load and validate CSV file"""
+    def load_csv_file(uploaded_file, usecols=None, dtype=None, as_polars=False):
+        """Load and validate CSV file
+        
+        Uses Polars' multithreaded reader when it is installed. Returns a pandas
+        DataFrame unless as_polars is True and Polars is available. When usecols
+        is given only those columns are parsed; any that are missing are left
+        for the validators to report. Parsed files are cached across reruns.
+        """
         try:
             if uploaded_file is not None:
-                # Read the CSV file
-                df = pd.read_csv(uploaded_file)
-                return df
+                return _load_csv_cached(uploaded_file.getvalue(), uploaded_file.name, usecols, dtype, as_polars)
             return None
         except Exception as e:
             st.error(f"Error loading file: {str(e)}")
             return None
     
     @staticmethod
-    def validate_anchorage_file(df):
-        """Validate Anchorage Transaction Report format"""
-        required_columns = [
-            'End Time', 'Type', 'Asset Type', 'Asset Quantity (Before Fee)',
-            'Value (USD)', 'Fee Quantity', 'Fee Value (USD)', 'Fee Asset Type',
-            'Source Addresses', 'Destination Address'
-        ]
+    def _read_csv(source, usecols=None, dtype=None, as_polars=False):
+        """Parse a CSV buffer with Polars if available, otherwise pandas"""
+        if pl is not None and dtype is None:
+            try:
+                df = pl.read_csv(source.getvalue(), columns=usecols, try_parse_dates=False, rechunk=False)
+                return df if as_polars else FileProcessor._categorize(df.to_pandas())
+            except Exception:
+                source.seek(0)  # Fall back to pandas below
         
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        
-        if missing_columns:
-            st.error(f"Missing required columns: {', '.join(missing_columns)}")
-            return False
+        # Read the CSV file, projecting only the requested columns; the pyarrow
+        # engine parses multithreaded, the C engine is the fallback
+        present_columns = FileProcessor._present_columns(source, usecols)
+        try:
+            df = pd.read_csv(source, usecols=present_columns, dtype=dtype, engine='pyarrow')
+            # pyarrow infers short hex addresses such as 0x1 as integers; the C engine
+            # keeps them as text, so reread when an identifier column came back numeric
+            if not any(FileProcessor._has_numeric_values(df, col) for col in CATEGORY_COLS):
+                return FileProcessor._categorize(df)
+        except Exception:
+            pass
         
-        return True
+        source.seek(0)
+        df = pd.read_csv(source, usecols=present_columns, dtype=dtype, engine='c')
+        return FileProcessor._categorize(df)
     
     @staticmethod
-    def validate_wallets_list(df):
-        """Validate Wallets List format"""
-        required_columns = ['ID', 'Name', 'Addresses']
-        
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        
-        if missing_columns:
-            st.error(f"Missing required columns in Wallets List: {', '.join(missing_columns)}")
-            return False
-        
-        return True
+    def _has_numeric_values(df, col):
+        """Whether df has column col parsed as numbers (all-empty columns don't count)"""
+        return col in df.columns and pd.api.types.is_numeric_dtype(df[col]) and df[col].notna().any()
     
     @staticmethod
-    def validate_vesting_pairs(df):
-        """Validate Vesting Wallet Pairs format"""
-        required_columns = ['Beneficiary Wallet', 'Originating Wallet']
-        
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        
-        if missing_columns:
-            st.error(f"Missing required columns in Vesting Wallet Pairs: {', '.join(missing_columns)}")
-            return False
-        
-        return True
+    def _present_columns(source, usecols):
+        """Resolve usecols against the CSV header so missing columns are skipped, not rejected"""
+        if usecols is None:
+            return None
+        header = pd.read_csv(source, nrows=0).columns
+        source.seek(0)
+        wanted = set(usecols)
+        return [col for col in header if col in wanted]
     
     @staticmethod
-    def validate_bitwave_file(df):
-        """Validate Bitwave Transactions Export format"""
-        required_columns = ['id', 'dateTime', 'walletId', 'amount']
-        
-        missing_columns = [col for col in required_columns if col not in df.columns]
+    def _categorize(df):
+        """Store wallet identifier columns (CATEGORY_COLS) as categoricals"""
+        for col in CATEGORY_COLS:
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+        return df
+    
+    @staticmethod
+    def validate(df, kind):
+        """Validate a file against its SCHEMA_REGISTRY entry; returns (is_valid, missing_columns) without UI calls"""
+        required_columns = SCHEMA_REGISTRY[kind]
         
-        if missing_columns:
-            st.error(f"Missing required columns in Bitwave Export: {', '.join(missing_columns)}")
-            return False
+        present_columns = set(df.columns)
+        if present_columns.issuperset(required_columns):
+            return True, []
         
-        return True
+        missing_columns = [col for col in required_columns if col not in present_columns]
+        return False, missing_columns
+    
+    @staticmethod
+    def missing_columns_message(kind, missing_columns):
+        """Error message for a file that failed validate()"""
+        location = f" in {SCHEMA_LABELS[kind]}" if SCHEMA_LABELS[kind] else ""
+        return f"Missing required columns{location}: {', '.join(missing_columns)}"
     
     @staticmethod
     def create_download_link(df, filename, link_text="Download CSV"):
-        """Create a download link for a DataFrame"""
-        csv = df.to_csv(index=False)
-        csv_bytes = csv.encode('utf-8')
+        """Create a download link for a pandas or Polars DataFrame"""
+        if pl is not None and isinstance(df, pl.DataFrame):
+            # Polars' writer is already parallel; no pandas/Arrow round trip needed
+            buffer = io.BytesIO()
+            df.write_csv(buffer)
+            csv_bytes = buffer.getvalue()
+        else:
+            csv_bytes = dataframe_to_csv_bytes(df)
         
         return st.download_button(
             label=link_text,
@@ -88,21 +151,16 @@ class FileProcessor:
             mime='text/csv'
         )
     
+    @staticmethod
+    def parse_date_series(series):
+        """Parse a whole column of date strings at once (unparseable values become NaT)"""
+        return pd.to_datetime(series, format='mixed', cache=True, errors='coerce')
+    
     @staticmethod
     def parse_date(date_string):
-        """Parse date string into datetime object"""
+        """Parse date string into datetime object (prefer parse_date_series for columns)"""
         try:
-            # Handle different date formats
-            formats = ['%Y-%m-%d', '%m/%d/%Y', '%Y-%m-%d %H:%M:%S', '%m/%d/%Y %H:%M:%S']
-            
-            for fmt in formats:
-                try:
-                    return datetime.strptime(str(date_string), fmt)
-                except ValueError:
-                    continue
-            
-            # If none of the formats work, try pandas
-            return pd.to_datetime(date_string)
+            return pd.Timestamp(str(date_string))
             
         except Exception as e:
             st.warning(f"Could not parse date: {date_string}")
@@ -110,12 +168,15 @@ class FileProcessor:
     
     @staticmethod
     def filter_date_range(df, date_column, start_date, end_date):
-        """Filter DataFrame by date range"""
+        """Filter DataFrame by date range (the caller's DataFrame is not modified)"""
         try:
-            df[date_column] = pd.to_datetime(df[date_column])
+            dates = df[date_column]
+            if not pd.api.types.is_datetime64_any_dtype(dates):
+                dates = FileProcessor.parse_date_series(dates)
             
-            mask = (df[date_column] >= start_date) & (df[date_column] <= end_date)
-            return df[mask]
+            values = dates.to_numpy()
+            mask = (values >= pd.Timestamp(start_date).to_datetime64()) & (values <= pd.Timestamp(end_date).to_datetime64())
+            return df.iloc[mask]
             
         except Exception as e:
             st.error(f"Error filtering by date range: {str(e)}")
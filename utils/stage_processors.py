@@ -1,46 +1,138 @@
 import pandas as pd
+import numpy as np
 import streamlit as st
-from datetime import datetime, timedelta
 import sys
 import os
+from collections import defaultdict
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.id_generator import get_id_generator
+from id_generator import get_id_generator
+
+try:
+    import polars as pl
+except ImportError:  # Polars is optional; Stage 1 falls back to the pandas group-by
+    pl = None
+
+# Bitwave columns Stage 3 reads; _prep_bitwave's cache key covers exactly these
+_BITWAVE_COLUMNS = ['id', 'dateTime', 'walletId', 'amount']
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _prep_bitwave(content_hash, _bitwave_df):
+    """Parse and time-sort a Bitwave export; cached on content_hash so reruns skip the date parse
+    
+    st.cache_data hashes frames of 50,000+ rows from a sample, so the frame itself
+    is left unhashed and callers pass a hash of every row (see _bitwave_content_hash).
+    """
+    date_times = pd.to_datetime(_bitwave_df['dateTime'], errors='coerce', cache=True)
+    if getattr(date_times.dt, "tz", None) is not None:
+        # Compare in naive time, as app.py's parse_timestamps does (e.g. ISO "...Z" exports)
+        date_times = date_times.dt.tz_convert(None)
+    
+    transactions = _bitwave_df[['id', 'amount']].assign(
+        walletId=_bitwave_df['walletId'].astype('category'),
+        dateTime=date_times,
+        position=np.arange(len(_bitwave_df))
+    )
+    
+    return transactions.dropna(subset=['dateTime']).sort_values('dateTime', kind='stable')
+
+def _bitwave_content_hash(bitwave_df):
+    """Hash every row of the Bitwave columns, with its position, for _prep_bitwave's cache key"""
+    rows = bitwave_df[_BITWAVE_COLUMNS].reset_index(drop=True)
+    return int(pd.util.hash_pandas_object(rows, index=True).sum())
 
 class StageProcessor:
     """Handles all stage processing operations"""
     
+    # Bitwave import rows with their constant fields; None marks the per-row fields
+    _STAGE2_ROW_TEMPLATE = {
+        'id': None,
+        'remoteContactId': '',
+        'amount': None,
+        'amountTicker': 'APT',
+        'cost': None,
+        'costTicker': 'USD',
+        'fee': '',
+        'feeTicker': '',
+        'time': None,
+        'blockchainId': None,
+        'memo': '',
+        'transactionType': None,
+        'accountId': None,
+        'contactId': '',
+        'categoryId': '',
+        'taxExempt': 'FALSE',
+        'tradeId': '',
+        'description': 'vesting distribution per Anchorage report',
+        'fromAddress': '',
+        'toAddress': '',
+        'groupId': ''
+    }
+    
+    # Lookup failures are collected per kind and reported once per stage
+    _ERROR_MESSAGES = {
+        'missing_withdraw': "Missing a vesting tokens wallet",
+        'missing_originating': "No Originating Wallet Match in the Vesting Wallet Pairs table for",
+        'missing_beneficiary': "No Beneficiary Wallet Match in the Wallets list for"
+    }
+    
+    _STAGE3_ROW_TEMPLATE = {
+        'id': None,
+        'remoteContactId': '',
+        'amount': None,
+        'amountTicker': 'APT',
+        'cost': '',
+        'costTicker': '',
+        'fee': '',
+        'feeTicker': '',
+        'time': None,
+        'blockchainId': None,
+        'memo': '',
+        'transactionType': 'deposit',
+        'accountId': None,
+        'contactId': 'nFc4OUI5w6wSa6zFKQVj.526',
+        'categoryId': 'nFc4OUI5w6wSa6zFKQVj.265',
+        'taxExempt': 'FALSE',
+        'tradeId': '',
+        'description': 'staking reward from vesting distribution per Anchorage report',
+        'fromAddress': '',
+        'toAddress': '',
+        'groupId': ''
+    }
+    
     @staticmethod
     def process_stage_1(anchorage_df, wallets_df):
         """Stage 1: Vesting Outflows per Anchorage File"""
         try:
-            # Filter for Balance Adjustment transactions
-            balance_adjustments = anchorage_df[anchorage_df['Type'] == 'Balance Adjustment'].copy()
+            # Filter for Balance Adjustment transactions, projecting only the columns Stage 1 needs
+            balance_adjustments = anchorage_df.loc[
+                anchorage_df['Type'] == 'Balance Adjustment',
+                ['End Time', 'Destination Address', 'Asset Quantity (Before Fee)', 'Value (USD)']
+            ]
             
             if balance_adjustments.empty:
                 st.warning("No Balance Adjustment transactions found in the data.")
                 return pd.DataFrame()
             
-            # Parse dates
-            balance_adjustments['End Time'] = pd.to_datetime(balance_adjustments['End Time'])
-            balance_adjustments['Date'] = balance_adjustments['End Time'].dt.date
+            # Parse dates; group on integer category codes rather than address strings
+            # (the cast is a no-op if the column was loaded as categorical)
+            balance_adjustments = balance_adjustments.assign(**{
+                'Date': pd.to_datetime(balance_adjustments['End Time']).dt.date,
+                'Destination Address': balance_adjustments['Destination Address'].astype('category')
+            })
             
             # Group by date and destination address
-            grouped = balance_adjustments.groupby(['Date', 'Destination Address']).agg({
-                'Asset Quantity (Before Fee)': 'sum',
-                'Value (USD)': 'sum'
-            }).reset_index()
+            grouped = StageProcessor._sum_by_date_and_address(balance_adjustments)
             
             # Replace destination addresses with wallet names where possible
-            grouped['Wallet Name'] = grouped['Destination Address'].copy()
+            grouped['Wallet Name'] = grouped['Destination Address'].astype(object)
             
             # Create wallets lookup dictionary (Address -> Name)
             if not wallets_df.empty and 'Addresses' in wallets_df.columns and 'Name' in wallets_df.columns:
-                wallets_lookup = dict(zip(wallets_df['Addresses'], wallets_df['Name']))
+                named_wallets = wallets_df[wallets_df['Addresses'].notna()]
+                wallets_lookup = dict(zip(named_wallets['Addresses'], named_wallets['Name']))
                 
-                # Replace addresses with wallet names
-                for addr, name in wallets_lookup.items():
-                    if pd.notna(addr):
-                        grouped.loc[grouped['Destination Address'] == addr, 'Wallet Name'] = name
+                # Replace addresses with wallet names in a single hashed pass
+                grouped['Wallet Name'] = grouped['Wallet Name'].map(wallets_lookup).fillna(grouped['Wallet Name'])
             
             # Reorder columns
             result = grouped[['Date', 'Wallet Name', 'Asset Quantity (Before Fee)', 'Value (USD)']]
@@ -52,6 +144,29 @@ class StageProcessor:
             st.error(f"Error in Stage 1 processing: {str(e)}")
             return pd.DataFrame()
     
+    @staticmethod
+    def _sum_by_date_and_address(balance_adjustments):
+        """Sum quantity and USD value per date and destination address, with Polars if available"""
+        if pl is not None:
+            try:
+                grouped = (
+                    pl.from_pandas(balance_adjustments[['Date', 'Destination Address', 'Asset Quantity (Before Fee)', 'Value (USD)']])
+                    .drop_nulls(['Date', 'Destination Address'])
+                    .group_by(['Date', 'Destination Address'], maintain_order=True)
+                    .agg(pl.col('Asset Quantity (Before Fee)').sum(), pl.col('Value (USD)').sum())
+                    .to_pandas()
+                )
+                # Polars returns dates as datetime64; Stages 2 and 3 key on datetime.date
+                grouped['Date'] = pd.to_datetime(grouped['Date']).dt.date
+                return grouped
+            except Exception:
+                pass  # Fall back to pandas below
+        
+        return balance_adjustments.groupby(['Date', 'Destination Address'], observed=True).agg({
+            'Asset Quantity (Before Fee)': 'sum',
+            'Value (USD)': 'sum'
+        }).reset_index()
+    
     @staticmethod
     def process_stage_2(stage1_df, wallets_df, vesting_pairs_df):
         """Stage 2: Creating Vesting Transfers to Beneficiary Wallets"""
@@ -60,133 +175,104 @@ class StageProcessor:
                 st.error("No Stage 1 data available for Stage 2 processing")
                 return pd.DataFrame()
             
-            output_rows = []
+            stage1_df = stage1_df.reset_index(drop=True)
+            wallet_names = stage1_df['Wallet Name'].astype(str)
             
-            for _, row in stage1_df.iterrows():
-                date = row['Date']
-                wallet_name = row['Wallet Name']
-                amount = row['Asset Quantity (Before Fee)']
-                cost = row['Value (USD)']
-                
-                # Format time as 12:00 PM
-                time_formatted = datetime.combine(date, datetime.min.time().replace(hour=12)).strftime('%m/%d/%Y %H:%M:%S')
-                
-                # Get unique IDs for both rows
-                withdrawal_id = get_id_generator().get_next_id()
-                deposit_id = get_id_generator().get_next_id()
-                
-                # Create withdrawal row
-                withdrawal_account_id = StageProcessor._get_withdrawal_account_id(wallet_name, wallets_df)
-                if withdrawal_account_id:
-                    blockchain_id = f"{withdrawal_account_id}.vestingdistribute.{date.strftime('%m%d%y')}"
-                    
-                    withdrawal_row = {
-                        'id': withdrawal_id,
-                        'remoteContactId': '',
-                        'amount': amount,
-                        'amountTicker': 'APT',
-                        'cost': cost,
-                        'costTicker': 'USD',
-                        'fee': '',
-                        'feeTicker': '',
-                        'time': time_formatted,
-                        'blockchainId': blockchain_id,
-                        'memo': '',
-                        'transactionType': 'withdrawal',
-                        'accountId': withdrawal_account_id,
-                        'contactId': '',
-                        'categoryId': '',
-                        'taxExempt': 'FALSE',
-                        'tradeId': '',
-                        'description': 'vesting distribution per Anchorage report',
-                        'fromAddress': '',
-                        'toAddress': '',
-                        'groupId': ''
-                    }
-                    output_rows.append(withdrawal_row)
-                
-                # Create deposit row
-                deposit_account_id = StageProcessor._get_deposit_account_id(wallet_name, wallets_df, vesting_pairs_df)
-                if deposit_account_id:
-                    blockchain_id = f"{deposit_account_id}.vestingdistribute.{date.strftime('%m%d%y')}"
-                    
-                    deposit_row = {
-                        'id': deposit_id,
-                        'remoteContactId': '',
-                        'amount': amount,
-                        'amountTicker': 'APT',
-                        'cost': cost,
-                        'costTicker': 'USD',
-                        'fee': '',
-                        'feeTicker': '',
-                        'time': time_formatted,
-                        'blockchainId': blockchain_id,
-                        'memo': '',
-                        'transactionType': 'deposit',
-                        'accountId': deposit_account_id,
-                        'contactId': '',
-                        'categoryId': '',
-                        'taxExempt': 'FALSE',
-                        'tradeId': '',
-                        'description': 'vesting distribution per Anchorage report',
-                        'fromAddress': '',
-                        'toAddress': '',
-                        'groupId': ''
-                    }
-                    output_rows.append(deposit_row)
-            
-            return pd.DataFrame(output_rows)
+            indexes = StageProcessor._build_indexes(wallets_df, vesting_pairs_df)
+            name_to_id = indexes['name_to_id']
+            orig_to_benef = indexes['orig_to_benef']
             
-        except Exception as e:
-            st.error(f"Error in Stage 2 processing: {str(e)}")
-            return pd.DataFrame()
-    
-    @staticmethod
-    def _get_withdrawal_account_id(wallet_name, wallets_df):
-        """Get account ID for withdrawal row"""
-        try:
-            # Remove "Aptos" prefix if present
-            search_name = wallet_name.replace("Aptos ", "") if wallet_name.startswith("Aptos ") else wallet_name
-            search_name = search_name + " vesting tokens"
+            # Withdrawal account: "<name without 'Aptos '> vesting tokens" in the wallets list,
+            # with the search names built for the whole column at once
+            withdrawal_ids = (wallet_names.str.removeprefix('Aptos ') + " vesting tokens").map(name_to_id)
             
-            # Search for matching name in wallets list
-            match = wallets_df[wallets_df['Name'] == search_name]
+            # Deposit account: originating wallet -> beneficiary wallet -> wallets list ID
+            has_originating = wallet_names.isin(list(orig_to_benef))
+            beneficiary_wallets = wallet_names.map(orig_to_benef)
+            deposit_ids = beneficiary_wallets.map(name_to_id)
             
-            if match.empty:
-                st.error(f"{wallet_name} is missing a vesting tokens wallet")
-                return None
+            errors = defaultdict(set)
+            errors['missing_withdraw'].update(wallet_names[withdrawal_ids.isna()])
+            errors['missing_originating'].update(wallet_names[~has_originating])
+            errors['missing_beneficiary'].update(beneficiary_wallets[has_originating & deposit_ids.isna()])
+            StageProcessor._report_errors(errors)
             
-            return match.iloc[0]['ID']
+            # Two IDs per Stage 1 row (withdrawal, then deposit), allocated even if a row is skipped
+            unique_ids = get_id_generator().get_multiple_ids(2 * len(stage1_df))
             
-        except Exception as e:
-            st.error(f"Error finding withdrawal account ID for {wallet_name}: {str(e)}")
-            return None
-    
-    @staticmethod
-    def _get_deposit_account_id(wallet_name, wallets_df, vesting_pairs_df):
-        """Get account ID for deposit row"""
-        try:
-            # Find originating wallet in vesting pairs
-            originating_match = vesting_pairs_df[vesting_pairs_df['Originating Wallet'] == wallet_name]
-            
-            if originating_match.empty:
-                st.error(f"No Originating Wallet Match in the Vesting Wallet Pairs table for {wallet_name}")
-                return None
-            
-            beneficiary_wallet = originating_match.iloc[0]['Beneficiary Wallet']
+            # Format time as 12:00 PM
+            noon = pd.to_datetime(stage1_df['Date']) + pd.Timedelta(hours=12)
+            time_formatted = noon.dt.strftime('%m/%d/%Y %H:%M:%S')
+            date_suffix = noon.dt.strftime('%m%d%y')
             
-            # Find beneficiary wallet in wallets list
-            beneficiary_match = wallets_df[wallets_df['Name'] == beneficiary_wallet]
+            withdrawal_rows = StageProcessor._stage2_rows(
+                stage1_df, unique_ids[0::2], withdrawal_ids, 'withdrawal', time_formatted, date_suffix
+            )
+            deposit_rows = StageProcessor._stage2_rows(
+                stage1_df, unique_ids[1::2], deposit_ids, 'deposit', time_formatted, date_suffix
+            )
             
-            if beneficiary_match.empty:
-                st.error(f"No Beneficiary Wallet Match in the Wallets list for {beneficiary_wallet}")
-                return None
-            
-            return beneficiary_match.iloc[0]['ID']
+            # Keep each Stage 1 row's withdrawal directly ahead of its deposit
+            output = pd.concat([withdrawal_rows, deposit_rows])
+            return output.sort_index(kind='stable').reset_index(drop=True)
             
         except Exception as e:
-            st.error(f"Error finding deposit account ID for {wallet_name}: {str(e)}")
+            st.error(f"Error in Stage 2 processing: {str(e)}")
+            return pd.DataFrame()
+    
+    @staticmethod
+    def _stage2_rows(stage1_df, unique_ids, account_ids, transaction_type, time_formatted, date_suffix):
+        """Build Stage 2 transfer rows for the Stage 1 rows that resolved to an account"""
+        rows = pd.DataFrame({
+            **StageProcessor._STAGE2_ROW_TEMPLATE,
+            'id': unique_ids,
+            'amount': stage1_df['Asset Quantity (Before Fee)'],
+            'cost': stage1_df['Value (USD)'],
+            'time': time_formatted,
+            'blockchainId': account_ids.astype(str).str.cat(date_suffix, sep='.vestingdistribute.'),
+            'transactionType': transaction_type,
+            'accountId': account_ids
+        }, index=stage1_df.index)
+        
+        return rows[account_ids.notna()]
+    
+    @staticmethod
+    def _build_indexes(wallets_df, vesting_pairs_df):
+        """Build hash lookups over the reference tables once per run (first match wins, as with iloc[0])"""
+        named_wallets = wallets_df.dropna(subset=['Name']).drop_duplicates(subset='Name', keep='first')
+        unique_ids = wallets_df.drop_duplicates(subset='ID', keep='first')
+        pairs = vesting_pairs_df.dropna(subset=['Originating Wallet']).drop_duplicates(subset='Originating Wallet', keep='first')
+        
+        return {
+            'name_to_id': dict(zip(named_wallets['Name'], named_wallets['ID'])),
+            'id_to_name': dict(zip(unique_ids['ID'], unique_ids['Name'])),
+            'orig_to_benef': dict(zip(pairs['Originating Wallet'], pairs['Beneficiary Wallet']))
+        }
+    
+    @staticmethod
+    def _report_errors(errors):
+        """Show one st.error per kind of lookup failure, listing every affected wallet"""
+        for kind, message in StageProcessor._ERROR_MESSAGES.items():
+            if errors[kind]:
+                st.error(f"{message}: {', '.join(sorted(map(str, errors[kind])))}")
+    
+    @staticmethod
+    def _get_deposit_account_id(wallet_name, indexes, errors):
+        """Get account ID for deposit row, recording lookup failures in errors"""
+        # Find originating wallet in vesting pairs
+        if wallet_name not in indexes['orig_to_benef']:
+            errors['missing_originating'].add(wallet_name)
             return None
+        
+        beneficiary_wallet = indexes['orig_to_benef'][wallet_name]
+        
+        # Find beneficiary wallet in wallets list
+        account_id = indexes['name_to_id'].get(beneficiary_wallet)
+        
+        if account_id is None:
+            errors['missing_beneficiary'].add(beneficiary_wallet)
+        
+        return account_id
     
     @staticmethod
     def process_stage_3(stage1_df, stage2_df, bitwave_df, wallets_df, vesting_pairs_df):
@@ -196,167 +282,149 @@ class StageProcessor:
                 st.error("No Stage 1 data available for Stage 3 processing")
                 return pd.DataFrame(), pd.DataFrame()
             
-            output_rows = []
-            display_rows = []
+            indexes = StageProcessor._build_indexes(wallets_df, vesting_pairs_df)
+            bitwave_index = StageProcessor._build_bitwave_index(bitwave_df)
+            
+            # Get deposit account ID (same logic as Stage 2 deposit), once per distinct wallet
+            errors = defaultdict(set)
+            account_ids = {
+                wallet_name: StageProcessor._get_deposit_account_id(wallet_name, indexes, errors)
+                for wallet_name in stage1_df['Wallet Name'].unique()
+            }
+            StageProcessor._report_errors(errors)
+            candidates = stage1_df[['Date', 'Wallet Name']].assign(
+                accountId=stage1_df['Wallet Name'].map(account_ids)
+            )
+            candidates = candidates[candidates['accountId'].notna()]
+            
+            # Find corresponding Stage 2 deposit amounts with one join (keeps Stage 1 order)
+            candidates = candidates.merge(
+                StageProcessor._build_stage2_deposits(stage2_df), on=['accountId', 'Date'], how='inner'
+            )
+            
+            # Calculate amount from Bitwave data; misses come back as NaN
+            candidates['Amount'], matched_transactions = StageProcessor._calculate_bitwave_amounts(
+                bitwave_index, candidates
+            )
+            
+            rewards = candidates[candidates['Amount'] > 0]
+            
+            # Format time as 12:00 PM
+            noon = pd.to_datetime(rewards['Date']) + pd.Timedelta(hours=12)
+            
+            # Reserve all Stage 3 IDs with a single counter update
+            unique_ids = get_id_generator().get_multiple_ids(len(rewards))
+            
+            output_df = pd.DataFrame({
+                **StageProcessor._STAGE3_ROW_TEMPLATE,
+                'id': unique_ids,
+                'amount': rewards['Amount'].to_numpy(),
+                'time': noon.dt.strftime('%m/%d/%Y %H:%M:%S').to_numpy(),
+                'blockchainId': (
+                    rewards['accountId'].astype(str) + ".vestingstakingrewards." + noon.dt.strftime('%m%d%y')
+                ).to_numpy(),
+                'accountId': rewards['accountId'].to_numpy()
+            })
             
-            for _, row in stage1_df.iterrows():
-                date = row['Date']
-                wallet_name = row['Wallet Name']
-                
-                # Get deposit account ID (same logic as Stage 2 deposit)
-                account_id = StageProcessor._get_deposit_account_id(wallet_name, wallets_df, vesting_pairs_df)
-                if not account_id:
-                    continue
-                
-                # Find corresponding Stage 2 deposit amount
-                stage2_deposit_amount = StageProcessor._get_stage2_deposit_amount(stage2_df, account_id, date)
-                if stage2_deposit_amount is None:
-                    continue
-                
-                # Calculate amount from Bitwave data
-                calculated_amount = StageProcessor._calculate_bitwave_amount(
-                    bitwave_df, account_id, date, stage2_deposit_amount
-                )
-                
-                if calculated_amount is None or calculated_amount <= 0:
-                    continue
-                
-                # Format time as 12:00 PM
-                time_formatted = datetime.combine(date, datetime.min.time().replace(hour=12)).strftime('%m/%d/%Y %H:%M:%S')
-                
-                # Get unique ID
-                unique_id = get_id_generator().get_next_id()
-                
-                # Create blockchain ID
-                blockchain_id = f"{account_id}.vestingstakingrewards.{date.strftime('%m%d%y')}"
-                
-                # Create output row
-                output_row = {
-                    'id': unique_id,
-                    'remoteContactId': '',
-                    'amount': calculated_amount,
-                    'amountTicker': 'APT',
-                    'cost': '',
-                    'costTicker': '',
-                    'fee': '',
-                    'feeTicker': '',
-                    'time': time_formatted,
-                    'blockchainId': blockchain_id,
-                    'memo': '',
-                    'transactionType': 'deposit',
-                    'accountId': account_id,
-                    'contactId': 'nFc4OUI5w6wSa6zFKQVj.526',
-                    'categoryId': 'nFc4OUI5w6wSa6zFKQVj.265',
-                    'taxExempt': 'FALSE',
-                    'tradeId': '',
-                    'description': 'staking reward from vesting distribution per Anchorage report',
-                    'fromAddress': '',
-                    'toAddress': '',
-                    'groupId': ''
-                }
-                output_rows.append(output_row)
-                
-                # Create display row (get wallet name from account ID)
-                display_wallet_name = StageProcessor._get_wallet_name_from_id(account_id, wallets_df)
-                display_row = {
-                    'Date': date,
-                    'Wallet Name': display_wallet_name,
-                    'Amount': calculated_amount
-                }
-                display_rows.append(display_row)
+            # Display rows (get wallet name from account ID)
+            id_to_name = indexes['id_to_name']
+            display_df = pd.DataFrame({
+                'Date': rewards['Date'].to_numpy(),
+                'Wallet Name': [
+                    id_to_name.get(account_id, f"Unknown Wallet ({account_id})")
+                    for account_id in rewards['accountId']
+                ],
+                'Amount': rewards['Amount'].to_numpy()
+            })
+            
+            # Store the matched bitwave transactions for Stage 4 in a single session write
+            st.session_state['stage3_matched_transactions'] = matched_transactions
             
-            return pd.DataFrame(output_rows), pd.DataFrame(display_rows)
+            return output_df, display_df
             
         except Exception as e:
             st.error(f"Error in Stage 3 processing: {str(e)}")
             return pd.DataFrame(), pd.DataFrame()
     
     @staticmethod
-    def _get_stage2_deposit_amount(stage2_df, account_id, date):
-        """Get the deposit amount from Stage 2 for matching account and date"""
-        try:
-            # Filter for deposit transactions with matching account ID
-            deposits = stage2_df[
-                (stage2_df['transactionType'] == 'deposit') & 
-                (stage2_df['accountId'] == account_id)
-            ]
-            
-            if deposits.empty:
-                return None
-            
-            # Find matching date (convert stage2 time to date)
-            for _, deposit_row in deposits.iterrows():
-                deposit_date = datetime.strptime(deposit_row['time'], '%m/%d/%Y %H:%M:%S').date()
-                if deposit_date == date:
-                    return deposit_row['amount']
-            
-            return None
-            
-        except Exception as e:
-            st.error(f"Error getting Stage 2 deposit amount: {str(e)}")
-            return None
+    def _build_stage2_deposits(stage2_df):
+        """Stage 2 deposit amounts by accountId and Date (first deposit wins for repeats)"""
+        if stage2_df.empty:
+            return pd.DataFrame(columns=['accountId', 'Date', 'stage2_amount'])
+        
+        deposits = stage2_df[stage2_df['transactionType'] == 'deposit']
+        deposits = pd.DataFrame({
+            'accountId': deposits['accountId'],
+            'Date': pd.to_datetime(deposits['time'], format='%m/%d/%Y %H:%M:%S').dt.date,
+            'stage2_amount': deposits['amount']
+        })
+        
+        return deposits.drop_duplicates(subset=['accountId', 'Date'], keep='first')
     
     @staticmethod
-    def _calculate_bitwave_amount(bitwave_df, account_id, date, stage2_amount):
-        """Calculate amount from Bitwave data based on criteria"""
-        try:
-            # Filter Bitwave data for matching wallet ID
-            wallet_transactions = bitwave_df[bitwave_df['walletId'] == account_id]
-            
-            if wallet_transactions.empty:
-                return None
-            
-            # Convert date to datetime for comparison
-            base_date = datetime.combine(date, datetime.min.time())
-            end_date = base_date + timedelta(days=10)
-            
-            # Filter for date range (after base date, within 10 days)
-            wallet_transactions['dateTime'] = pd.to_datetime(wallet_transactions['dateTime'])
-            date_filtered = wallet_transactions[
-                (wallet_transactions['dateTime'] > base_date) & 
-                (wallet_transactions['dateTime'] <= end_date)
-            ]
-            
-            if date_filtered.empty:
-                return None
-            
-            # Filter for amounts greater than Stage 2 deposit amount
-            amount_filtered = date_filtered[date_filtered['amount'] > stage2_amount]
-            
-            if amount_filtered.empty:
-                return None
-            
-            # Use the first matching transaction
-            bitwave_amount = amount_filtered.iloc[0]['amount']
-            calculated_amount = bitwave_amount - stage2_amount
-            
-            # Store the matched bitwave transaction for Stage 4
-            if 'stage3_matched_transactions' not in st.session_state:
-                st.session_state['stage3_matched_transactions'] = []
-            
-            st.session_state['stage3_matched_transactions'].append({
-                'id': amount_filtered.iloc[0]['id'],
-                'bitwave_amount': bitwave_amount,
-                'stage2_amount': stage2_amount,
-                'calculated_amount': calculated_amount
-            })
-            
-            return calculated_amount
-            
-        except Exception as e:
-            st.error(f"Error calculating Bitwave amount: {str(e)}")
-            return None
+    def _build_bitwave_index(bitwave_df):
+        """Group each wallet's Bitwave transactions as time-sorted arrays"""
+        transactions = _prep_bitwave(_bitwave_content_hash(bitwave_df), bitwave_df)
+        return {
+            wallet_id: (
+                group['dateTime'].to_numpy(),
+                group['amount'].to_numpy(),
+                group['id'].to_numpy(),
+                group['position'].to_numpy()
+            )
+            for wallet_id, group in transactions.groupby('walletId', sort=False, observed=True)
+        }
     
     @staticmethod
-    def _get_wallet_name_from_id(account_id, wallets_df):
-        """Get wallet name from account ID"""
-        try:
-            match = wallets_df[wallets_df['ID'] == account_id]
-            if not match.empty:
-                return match.iloc[0]['Name']
-            return f"Unknown Wallet ({account_id})"
-        except:
-            return f"Unknown Wallet ({account_id})"
+    def _calculate_bitwave_amounts(bitwave_index, candidates):
+        """Calculate amounts from Bitwave data for each candidate row, searching one wallet at a time
+        
+        Fills preallocated per-candidate buffers and returns the calculated amounts
+        (NaN where nothing matched) and a frame of the matched transactions for
+        Stage 4, both in candidate order.
+        """
+        stage2_amounts = candidates['stage2_amount'].to_numpy(dtype=float)
+        base_dates = pd.to_datetime(candidates['Date']).to_numpy()
+        end_dates = base_dates + np.timedelta64(10, 'D')
+        
+        bitwave_amounts = np.full(len(candidates), np.nan)
+        matched_ids = np.full(len(candidates), None, dtype=object)
+        
+        for account_id, rows in candidates.groupby('accountId', sort=False).indices.items():
+            # Bitwave transactions for the matching wallet ID
+            wallet_transactions = bitwave_index.get(account_id)
+            if wallet_transactions is None:
+                continue
+            
+            times, amounts, ids, positions = wallet_transactions
+            
+            # Date range (after base date, within 10 days) for all of this wallet's rows in two binary searches
+            window_starts = times.searchsorted(base_dates[rows], side='right')
+            window_ends = times.searchsorted(end_dates[rows], side='right')
+            
+            for row, lo, hi in zip(rows, window_starts, window_ends):
+                # Filter for amounts greater than Stage 2 deposit amount
+                qualifying = np.flatnonzero(amounts[lo:hi] > stage2_amounts[row])
+                if qualifying.size == 0:
+                    continue
+                
+                # Use the first matching transaction in export order
+                match = lo + qualifying[positions[lo:hi][qualifying].argmin()]
+                bitwave_amounts[row] = amounts[match]
+                matched_ids[row] = ids[match]
+        
+        calculated_amounts = bitwave_amounts - stage2_amounts
+        
+        # Record the matched bitwave transactions for Stage 4, straight from the filled buffers
+        matched = ~np.isnan(bitwave_amounts)
+        matched_transactions = pd.DataFrame({
+            'id': matched_ids[matched],
+            'bitwave_amount': bitwave_amounts[matched],
+            'stage2_amount': stage2_amounts[matched],
+            'calculated_amount': calculated_amounts[matched]
+        })
+        
+        return calculated_amounts, matched_transactions
     
     @staticmethod
     def process_stage_4():
@@ -366,15 +434,12 @@ class StageProcessor:
                 st.warning("No Stage 3 transactions found. Please run Stage 3 first.")
                 return pd.DataFrame()
             
-            output_rows = []
+            matched_transactions = st.session_state['stage3_matched_transactions']
             
-            for transaction in st.session_state['stage3_matched_transactions']:
-                output_rows.append({
-                    'transactionID': transaction['id'],
-                    'action': 'ignore'
-                })
-            
-            return pd.DataFrame(output_rows)
+            return pd.DataFrame({
+                'transactionID': matched_transactions['id'].to_numpy(),
+                'action': 'ignore'
+            })
             
         except Exception as e:
             st.error(f"Error in Stage 4 processing: {str(e)}")